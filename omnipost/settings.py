@@ -130,7 +130,13 @@ STORAGES = {
     },
 }
 
+# загрузка вложений: файлы пишутся на диск блоками, память воркера не растет
+FILE_UPLOAD_HANDLERS = ['postmanager.upload_handlers.LimitedHashingUploadHandler']
+UPLOAD_MAX_FILE_SIZE = config('UPLOAD_MAX_FILE_SIZE', default=50 * 1024 * 1024, cast=int)
+UPLOAD_MAX_REQUEST_SIZE = config('UPLOAD_MAX_REQUEST_SIZE', default=200 * 1024 * 1024, cast=int)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+# сессии хранятся на сервере (sqlite + lru кэш процесса), в cookie только ключ
+SESSION_ENGINE = 'postmanager.session_backend'
 SESSION_COOKIE_HTTPONLY = True
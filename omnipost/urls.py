@@ -19,9 +19,11 @@ urlpatterns = [
     path('api/tg-send-code/', views.tg_send_code, name='tg_send_code'),
     path('api/tg-verify-code/', views.tg_verify_code, name='tg_verify_code'),
     path('api/tg-disconnect/', views.tg_disconnect, name='tg_disconnect'),
+    path('api/tg-refresh-channels/', views.tg_refresh_channels, name='tg_refresh_channels'),
 
     # публикация постов
     path('api/publish-post/', views.publish_post, name='publish_post'),
+    path('api/publish-jobs/<str:job_id>/', views.get_publish_job, name='get_publish_job'),
 
     # управление токенами vk групп
     path('api/save-vk-group-token/', views.save_vk_group_token, name='save_vk_group_token'),
@@ -36,4 +38,7 @@ urlpatterns = [
 
     # получение недавних постов
     path('api/get-recent-posts/', views.get_recent_posts, name='get_recent_posts'),
+
+    # история публикаций
+    path('api/post-history/', views.get_post_history, name='get_post_history'),
 ]
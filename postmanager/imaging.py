@@ -0,0 +1,25 @@
+import os
+
+
+# обработка изображения в отдельном процессе: поворот по exif, уменьшение
+# до max_side, перекодирование без метаданных; dst без расширения,
+# результат пишется атомарно, возвращается итоговый путь
+def process_image(src: str, dst: str, max_side: int, quality: int) -> str:
+    from PIL import Image, ImageOps
+
+    with Image.open(src) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        # прозрачность сохраняется только в png
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            path = f'{dst}.png'
+            tmp_path = f'{path}.{os.getpid()}.part'
+            image.save(tmp_path, format='PNG', optimize=True)
+        else:
+            path = f'{dst}.jpg'
+            tmp_path = f'{path}.{os.getpid()}.part'
+            image.convert('RGB').save(tmp_path, format='JPEG', quality=quality, optimize=True, progressive=True)
+
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from postmanager.services import PostService
+
+
+# заполнение scheduled_at у запланированных постов, созданных до его появления
+class Command(BaseCommand):
+    help = 'заполняет поле scheduled_at (utc) у ожидающих запланированных постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=400)
+
+    def handle(self, *args, **options):
+        updated = PostService().backfill_scheduled_at(batch_size=options['batch_size'])
+        self.stdout.write(f'обновлено постов: {updated}')
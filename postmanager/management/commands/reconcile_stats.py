@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from postmanager.services import FirebaseService, StatsService
+
+
+# сверка счетчиков статистики пользователей с запланированными постами
+class Command(BaseCommand):
+    help = 'пересчитывает счетчик запланированных постов (count-агрегация) и удаляет старые дневные счетчики'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uid', help='только указанный пользователь')
+        parser.add_argument('--keep-days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        stats_service = StatsService()
+
+        if options['uid']:
+            uids = [options['uid']]
+        else:
+            users = FirebaseService().db.collection(StatsService.COLLECTION).select([]).stream()
+            uids = [doc.id for doc in users]
+
+        for uid in uids:
+            try:
+                result = stats_service.reconcile(uid, keep_days=options['keep_days'])
+                self.stdout.write(f"{uid}: запланировано {result['scheduled']}, удалено дней {result['pruned_days']}")
+            except Exception as e:
+                self.stderr.write(f'{uid}: ошибка сверки: {e}')
@@ -2,16 +2,42 @@ from .firebase_service import FirebaseService
 from .auth_service import AuthService
 from .post_service import PostService
 from .user_service import UserService
+from .profile_service import ProfileService
 from .vk_service import VKService
+from .vk_media_service import VKMediaService
 from .telegram_service import TelegramService
 from .crypto_service import CryptoService
+from .fanout_service import FanoutService
+from .telegram_pool_service import TelegramPoolService
+from .scheduled_timer_service import ScheduledTimerService
+from .scheduled_worker_service import ScheduledWorkerService
+from .rate_limit_service import RateLimitService
+from .attachment_service import AttachmentService
+from .media_preprocess_service import MediaPreprocessService
+from .post_history_service import PostHistoryService
+from .stats_service import StatsService
+from .publish_job_service import PublishJobService
+from .channel_discovery_service import ChannelDiscoveryService
 
 __all__ = [
     'FirebaseService',
     'AuthService',
     'UserService',
+    'ProfileService',
     'VKService',
+    'VKMediaService',
     'TelegramService',
     'PostService',
-    'CryptoService'
+    'CryptoService',
+    'FanoutService',
+    'TelegramPoolService',
+    'ScheduledTimerService',
+    'ScheduledWorkerService',
+    'RateLimitService',
+    'AttachmentService',
+    'MediaPreprocessService',
+    'PostHistoryService',
+    'StatsService',
+    'PublishJobService',
+    'ChannelDiscoveryService'
 ]
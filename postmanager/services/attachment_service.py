@@ -0,0 +1,183 @@
+import hashlib
+import os
+import shutil
+import time
+from decouple import config
+from django.core.files.storage import default_storage
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP, Increment, transactional
+from .firebase_service import FirebaseService
+
+
+# хранилище вложений по sha256 содержимого: одинаковые файлы хранятся один раз,
+# посты ссылаются на id (хэш), файл удаляется, когда на него не осталось ссылок
+class AttachmentService:
+    COLLECTION = 'attachments'
+    CHUNK_SIZE = 1024 * 1024
+    # через сколько секунд брошенное удаление блоба (процесс упал) можно перехватить
+    DELETE_TIMEOUT = 60
+
+    def __init__(self):
+        self.firebase = FirebaseService()
+        self.local_dir = config('LOCAL_STORE_DIR', default='temp')
+
+    # путь блоба в хранилище
+    @staticmethod
+    def _blob_name(blob_id: str, ext: str) -> str:
+        return f'blobs/{blob_id[:2]}/{blob_id}{ext}'
+
+    # sha256 файла: посчитанный при приеме загрузки или по блокам
+    def _digest(self, uploaded_file) -> str:
+        precomputed = getattr(uploaded_file, 'sha256', None)
+        if precomputed:
+            return precomputed
+
+        digest = hashlib.sha256()
+        for chunk in uploaded_file.chunks(self.CHUNK_SIZE):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    # сохранение загруженного файла, возвращает id блоба (ссылка уже учтена);
+    # временный файл загрузки переносится в хранилище без чтения в память
+    def put(self, uploaded_file) -> str:
+        blob_id = self._digest(uploaded_file)
+        ext = os.path.splitext(uploaded_file.name)[1].lower()
+
+        db = self.firebase.db
+        doc_ref = db.collection(self.COLLECTION).document(blob_id)
+
+        # имя блоба задает первая загрузка: то же содержимое с другим расширением
+        # ссылается на уже сохраненный файл, а не заводит второй;
+        # None - последний release еще удаляет файл, документ нужно подождать
+        @transactional
+        def reference(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else None
+
+            if data and data.get('deleting_at'):
+                if time.time() - data['deleting_at'] < self.DELETE_TIMEOUT:
+                    return None
+                # удаление брошено: блоб заводится заново
+                data = None
+
+            if data and data.get('name'):
+                transaction.update(doc_ref, {'refcount': Increment(1), 'updated_at': SERVER_TIMESTAMP})
+                return data['name']
+
+            name = self._blob_name(blob_id, ext)
+            transaction.set(doc_ref, {
+                'name': name,
+                'original_name': uploaded_file.name,
+                'size': uploaded_file.size,
+                'refcount': 1,
+                'updated_at': SERVER_TIMESTAMP,
+            })
+            return name
+
+        name = reference(db.transaction())
+        while name is None:
+            time.sleep(0.1)
+            name = reference(db.transaction())
+
+        # файл пишется после учета ссылки, поэтому release не удалит его до конца загрузки
+        if not default_storage.exists(name):
+            uploaded_file.seek(0)
+            saved_name = default_storage.save(name, uploaded_file)
+            # тот же файл параллельно сохранил другой запрос: копия не нужна
+            if saved_name != name:
+                default_storage.delete(saved_name)
+
+        return blob_id
+
+    # дополнительные ссылки на блобы (новый пост с теми же вложениями)
+    def retain(self, blob_ids: list):
+        batch = self.firebase.db.batch()
+        for blob_id in blob_ids:
+            doc_ref = self.firebase.db.collection(self.COLLECTION).document(blob_id)
+            batch.update(doc_ref, {'refcount': Increment(1), 'updated_at': SERVER_TIMESTAMP})
+        batch.commit()
+
+    # снятие ссылки; блоб без ссылок удаляется вместе с файлом:
+    # документ помечается deleting_at и удаляется только после файла,
+    # поэтому параллельный put того же содержимого ждет, а не ссылается на удаляемый файл
+    def release(self, blob_id: str) -> bool:
+        db = self.firebase.db
+        doc_ref = db.collection(self.COLLECTION).document(blob_id)
+
+        @transactional
+        def decrement(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+
+            data = snapshot.to_dict()
+            if data.get('deleting_at'):
+                return None
+
+            if data.get('refcount', 0) <= 1:
+                deleting_at = time.time()
+                transaction.update(doc_ref, {'deleting_at': deleting_at, 'updated_at': SERVER_TIMESTAMP})
+                return data.get('name'), deleting_at
+
+            transaction.update(doc_ref, {'refcount': Increment(-1), 'updated_at': SERVER_TIMESTAMP})
+            return None
+
+        # документ удаляется, только если удаление не перехватил put после таймаута
+        @transactional
+        def finish_delete(transaction, deleting_at):
+            snapshot = doc_ref.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get('deleting_at') == deleting_at:
+                transaction.delete(doc_ref)
+
+        try:
+            orphan = decrement(db.transaction())
+            if orphan:
+                orphan_name, deleting_at = orphan
+                if orphan_name:
+                    default_storage.delete(orphan_name)
+                    self._drop_local_copy(orphan_name)
+                finish_delete(db.transaction(), deleting_at)
+            return True
+        except Exception as e:
+            print(f"Ошибка освобождения вложения {blob_id}: {e}")
+            return False
+
+    def release_many(self, blob_ids: list):
+        for blob_id in blob_ids or []:
+            self.release(blob_id)
+
+    # локальные копии блобов для хранилищ без файловой системы
+    def _local_copy_path(self, name: str) -> str:
+        return os.path.join(self.local_dir, 'blob_cache', os.path.basename(name))
+
+    def _drop_local_copy(self, name: str):
+        path = self._local_copy_path(name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    # локальный путь к файлу блоба для отправки в vk/tg
+    def local_path(self, blob_id: str) -> str | None:
+        doc = self.firebase.db.collection(self.COLLECTION).document(blob_id).get()
+        if not doc.exists or doc.to_dict().get('deleting_at'):
+            return None
+
+        name = doc.to_dict()['name']
+
+        try:
+            return default_storage.path(name)
+        except NotImplementedError:
+            pass
+
+        # удаленное хранилище (s3 и т.п.): копия скачивается один раз на узел
+        path = self._local_copy_path(name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.part'
+            with default_storage.open(name, 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, self.CHUNK_SIZE)
+            os.replace(tmp_path, path)
+
+        return path
+
+    def local_paths(self, blob_ids: list) -> list:
+        paths = [self.local_path(blob_id) for blob_id in blob_ids or []]
+        return [path for path in paths if path]
@@ -0,0 +1,70 @@
+import time
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+from .firebase_service import FirebaseService
+from .profile_service import ProfileService
+from .telegram_service import TelegramService
+
+
+# фоновый поиск tg каналов пользователя: выполняется в loop пула tg,
+# найденные каналы и состояние поиска хранятся в документе пользователя
+class ChannelDiscoveryService:
+    COLLECTION = 'users'
+
+    # поиски, идущие в этом процессе (uid -> future)
+    _running = {}
+
+    def __init__(self):
+        self.firebase = FirebaseService()
+        self.profiles = ProfileService()
+        self.tg_service = TelegramService()
+
+    # запуск поиска; full - просмотр всех диалогов, иначе только изменившихся
+    # после прошлого поиска; False, если поиск для пользователя уже идет
+    def start(self, uid: str, session_string: str, full: bool = False) -> bool:
+        future = self._running.get(uid)
+        if future is not None and not future.done():
+            return False
+
+        future = self.tg_service.pool.submit(self._discover(uid, session_string, full))
+        self._running[uid] = future
+        future.add_done_callback(lambda f: self._running.pop(uid, None) if self._running.get(uid) is f else None)
+        return True
+
+    # поиск и сохранение каналов (в loop пула tg, поэтому async клиент firestore)
+    async def _discover(self, uid: str, session_string: str, full: bool):
+        doc_ref = self.firebase.async_db.collection(self.COLLECTION).document(uid)
+
+        try:
+            since = None
+            if not full:
+                profile = await self.profiles.aload(uid)
+                since = ((profile.data or {}).get('tg_discovery') or {}).get('last_dialog_date')
+
+            await doc_ref.set({'tg_discovery': {'status': 'running', 'started_at': time.time()}}, merge=True)
+            self.profiles.invalidate(uid)
+
+            channels, newest = await self.tg_service._discover_channels_async(session_string, since)
+
+            # найденные каналы добавляются к сохраненным, удаляет их только пользователь
+            await doc_ref.set({
+                'tg_channels': {
+                    ch['id']: {'name': ch['name'], 'username': ch.get('username', '')}
+                    for ch in channels
+                },
+                'tg_discovery': {
+                    'status': 'done',
+                    'last_dialog_date': newest,
+                    'found': len(channels),
+                    'error': None,
+                    'updated_at': SERVER_TIMESTAMP,
+                },
+            }, merge=True)
+
+        except Exception as e:
+            print(f"Ошибка поиска каналов Telegram: {e}")
+            await doc_ref.set({
+                'tg_discovery': {'status': 'failed', 'error': str(e), 'updated_at': SERVER_TIMESTAMP}
+            }, merge=True)
+
+        finally:
+            self.profiles.invalidate(uid)
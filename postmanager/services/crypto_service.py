@@ -1,3 +1,7 @@
+import atexit
+import hashlib
+import threading
+from cachetools import TTLCache
 from cryptography.fernet import Fernet, InvalidToken
 from decouple import config
 
@@ -17,21 +21,74 @@ class CryptoService:
         key = config('FERNET_KEY')
         self._fernet = Fernet(key.encode() if isinstance(key, str) else key)
 
+        # расшифрованные секреты по sha256 шифротекста
+        self._cache = TTLCache(
+            maxsize=config('CRYPTO_CACHE_SIZE', default=1024, cast=int),
+            ttl=config('CRYPTO_CACHE_TTL', default=300, cast=int),
+        )
+        self._cache_lock = threading.Lock()
+
+        # открытые секреты не остаются в памяти после завершения процесса
+        atexit.register(self.clear_cache)
+
     # шифрование строки
     def encrypt(self, value: str) -> str:
         if not value:
             return value
         return self._fernet.encrypt(value.encode('utf-8')).decode('utf-8')
 
-    # расшифровка строки
-    def decrypt(self, value: str) -> str | None:
-        if not value:
-            return None
+    @staticmethod
+    def _cache_key(value: str) -> bytes:
+        return hashlib.sha256(value.encode('utf-8')).digest()
+
+    # расшифровка без кэша
+    def _decrypt(self, value: str) -> str | None:
         try:
             return self._fernet.decrypt(value.encode('utf-8')).decode('utf-8')
         except (InvalidToken, Exception):
             return None
 
+    # расшифровка строки
+    def decrypt(self, value: str) -> str | None:
+        if not value:
+            return None
+
+        key = self._cache_key(value)
+        with self._cache_lock:
+            decrypted = self._cache.get(key)
+        if decrypted is not None:
+            return decrypted
+
+        decrypted = self._decrypt(value)
+        if decrypted is not None:
+            with self._cache_lock:
+                self._cache[key] = decrypted
+        return decrypted
+
+    # расшифровка пакета строк {шифротекст: значение или None}; повторы расшифровываются один раз
+    def decrypt_many(self, values) -> dict:
+        keys = {value: self._cache_key(value) for value in values if value}
+
+        with self._cache_lock:
+            result = {value: self._cache.get(key) for value, key in keys.items()}
+
+        decrypted = {}
+        for value, plain in result.items():
+            if plain is None:
+                plain = self._decrypt(value)
+                result[value] = plain
+                if plain is not None:
+                    decrypted[keys[value]] = plain
+
+        with self._cache_lock:
+            self._cache.update(decrypted)
+        return result
+
+    # очистка кэша расшифрованных секретов
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
     # генерация нового ключа
     @staticmethod
     def generate_key() -> str:
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Callable
+from decouple import config
+
+
+# задача рассылки на одну площадку
+@dataclass
+class FanoutTask:
+    platform: str
+    account: str
+    func: Callable
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+
+
+# параллельная рассылка с ограничением по площадкам и аккаунтам
+class FanoutService:
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_pool()
+        return cls._instance
+
+    # инициализация пула потоков и лимитов
+    def _init_pool(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=config('FANOUT_MAX_WORKERS', default=32, cast=int),
+            thread_name_prefix='fanout',
+        )
+        self._platform_limit = {
+            'vk': config('FANOUT_VK_CONCURRENCY', default=10, cast=int),
+            'telegram': config('FANOUT_TG_CONCURRENCY', default=10, cast=int),
+        }
+        self._account_limit = config('FANOUT_ACCOUNT_CONCURRENCY', default=4, cast=int)
+
+        # выполняющиеся задачи по ключам лимитов и задачи, ждущие свободного места
+        self._active = {}
+        self._waiting = deque()
+        self._lock = threading.Lock()
+
+        # семафоры лимитов для корутинных задач, свои у каждого event loop:
+        # loop -> {ключ лимита: [семафор, число задач, использующих его]}
+        self._loop_semaphores = weakref.WeakKeyDictionary()
+
+    # ключи лимитов задачи: аккаунт и площадка
+    def _limits(self, task: FanoutTask) -> list[tuple]:
+        # токены и сессии не храним в открытом виде даже как ключи
+        account_key = hashlib.sha256(str(task.account).encode('utf-8')).hexdigest()
+
+        return [
+            (('account', task.platform, account_key), self._account_limit),
+            (('platform', task.platform), self._platform_limit.get(task.platform, self._account_limit)),
+        ]
+
+    def _has_slot(self, limits: list[tuple]) -> bool:
+        return all(self._active.get(key, 0) < limit for key, limit in limits)
+
+    # занятие мест и передача задачи в пул (под self._lock)
+    def _start(self, task: FanoutTask, limits: list[tuple], future: Future):
+        for key, _ in limits:
+            self._active[key] = self._active.get(key, 0) + 1
+        self._executor.submit(self._execute, task, limits, future)
+
+    # освобождение мест и запуск ожидающих задач, которым хватает лимитов
+    def _release(self, limits: list[tuple]):
+        with self._lock:
+            for key, _ in limits:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+
+            waiting = deque()
+            while self._waiting:
+                entry = self._waiting.popleft()
+                if self._has_slot(entry[1]):
+                    self._start(*entry)
+                else:
+                    waiting.append(entry)
+            self._waiting = waiting
+
+    # выполнение задачи в потоке пула: лимиты уже заняты, поток не ждет семафоров
+    def _execute(self, task: FanoutTask, limits: list[tuple], future: Future):
+        try:
+            result = task.func(*task.args, **task.kwargs)
+        except BaseException as e:
+            self._release(limits)
+            future.set_exception(e)
+        else:
+            self._release(limits)
+            future.set_result(result)
+
+    # постановка задачи: в пул она попадает, только когда есть место в лимитах
+    # аккаунта и площадки, поэтому тяжелый аккаунт не занимает потоки ожиданием
+    def submit(self, task: FanoutTask) -> Future:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        limits = self._limits(task)
+
+        with self._lock:
+            if self._has_slot(limits):
+                self._start(task, limits, future)
+            else:
+                self._waiting.append((task, limits, future))
+
+        return future
+
+    # результаты по мере завершения задач: пары (задача, результат)
+    def iter_results(self, tasks: list[FanoutTask]):
+        futures = {self.submit(task): task for task in tasks}
+
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    # выполнение всех задач, результаты в порядке задач
+    def run(self, tasks: list[FanoutTask]) -> list:
+        futures = [self.submit(task) for task in tasks]
+        return [future.result() for future in futures]
+
+    # корутинная задача под семафорами аккаунта и площадки текущего loop;
+    # семафор удаляется, когда его не использует ни одна задача
+    async def _arun_task(self, task: FanoutTask):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._loop_semaphores.setdefault(loop, {})
+
+        entries = []
+        for key, limit in self._limits(task):
+            entry = semaphores.get(key)
+            if entry is None:
+                entry = semaphores[key] = [asyncio.Semaphore(limit), 0]
+            entry[1] += 1
+            entries.append((key, entry))
+
+        (_, (account_semaphore, _)), (_, (platform_semaphore, _)) = entries
+
+        try:
+            async with account_semaphore, platform_semaphore:
+                return await task.func(*task.args, **task.kwargs)
+        finally:
+            for key, entry in entries:
+                entry[1] -= 1
+                if not entry[1]:
+                    semaphores.pop(key, None)
+
+    # запуск задачи из event loop: корутинные задачи выполняются в текущем loop,
+    # синхронные идут в пул потоков; лимиты аккаунта и площадки действуют в обоих случаях
+    def _afuture(self, task: FanoutTask) -> asyncio.Future:
+        if asyncio.iscoroutinefunction(task.func):
+            return asyncio.ensure_future(self._arun_task(task))
+        return asyncio.wrap_future(self.submit(task))
+
+    # выполнение из event loop, результаты в порядке задач
+    async def arun(self, tasks: list[FanoutTask]) -> list:
+        return list(await asyncio.gather(*(self._afuture(task) for task in tasks)))
+
+    # результаты из event loop по мере завершения задач: пары (задача, результат)
+    async def aiter_results(self, tasks: list[FanoutTask]):
+        futures = {self._afuture(task): task for task in tasks}
+        pending = set(futures)
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield futures[future], future.result()
@@ -1,5 +1,10 @@
+import asyncio
+import os
+import threading
+import weakref
 import firebase_admin
-from firebase_admin import credentials, auth, firestore
+from firebase_admin import credentials, auth
+from google.cloud import firestore
 from decouple import config
 
 
@@ -8,6 +13,11 @@ class FirebaseService:
     _instance = None
     _initialized = False
 
+    # клиенты firestore живут весь процесс (асинхронные — по одному на event loop, пока он открыт)
+    _client = None
+    _async_clients = weakref.WeakKeyDictionary()
+    _lock = threading.Lock()
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
@@ -36,12 +46,74 @@ class FirebaseService:
             })
             firebase_admin.initialize_app(cred)
 
-    # клиент firestore
+    # параметры клиента из firebase app
+    @staticmethod
+    def _client_options() -> dict:
+        app = firebase_admin.get_app()
+        return {
+            'project': app.project_id,
+            'credentials': app.credential.get_credential(),
+        }
+
+    # grpc-каналы не переживают fork: дочерний процесс создает клиентов заново
+    @classmethod
+    def _reset_after_fork(cls):
+        cls._client = None
+        cls._async_clients = weakref.WeakKeyDictionary()
+        cls._lock = threading.Lock()
+
+    # клиент firestore (один на процесс)
     @property
-    def db(self):
-        return firestore.client()
+    def db(self) -> firestore.Client:
+        if FirebaseService._client is None:
+            with FirebaseService._lock:
+                if FirebaseService._client is None:
+                    FirebaseService._client = firestore.Client(**self._client_options())
+        return FirebaseService._client
+
+    # асинхронный клиент firestore для текущего event loop
+    @property
+    def async_db(self) -> firestore.AsyncClient:
+        loop = asyncio.get_running_loop()
+
+        with FirebaseService._lock:
+            entry = FirebaseService._async_clients.get(loop)
+            if entry is None:
+                client = firestore.AsyncClient(**self._client_options())
+                entry = (client, self._start_closer(client))
+                FirebaseService._async_clients[loop] = entry
+
+        return entry[0]
+
+    # grpc-канал клиента закрывается вместе с его loop: asyncio.run и async_to_sync
+    # перед закрытием loop вызывают aclose у его async-генераторов
+    @classmethod
+    def _start_closer(cls, client):
+        closer = cls._close_with_loop(client)
+
+        # первый шаг до yield выполняется сразу и регистрирует генератор в текущем loop
+        try:
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        return closer
+
+    @staticmethod
+    async def _close_with_loop(client):
+        try:
+            yield
+        finally:
+            api = client._firestore_api_internal
+            if api is not None:
+                try:
+                    await api.transport.close()
+                except Exception as e:
+                    print(f"Ошибка закрытия клиента Firestore: {e}")
 
     # модуль auth
     @property
     def auth(self):
         return auth
+
+
+os.register_at_fork(after_in_child=FirebaseService._reset_after_fork)
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from decouple import config
+
+
+# локальная база sqlite в режиме wal, общая для веб-процессов и планировщика на узле
+class LocalStoreService:
+    def __init__(self, name: str, schema: str = ''):
+        directory = config('LOCAL_STORE_DIR', default='temp')
+        os.makedirs(directory, exist_ok=True)
+
+        self.path = os.path.join(directory, f'{name}.sqlite3')
+        self.schema = schema
+        self._local = threading.local()
+
+    # соединение текущего потока (sqlite3 не разделяет соединения между потоками)
+    def connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'connection', None)
+
+        # после fork соединение родителя использовать нельзя
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            if self.schema:
+                conn.executescript(self.schema)
+
+            self._local.connection = conn
+            self._local.pid = os.getpid()
+
+        return conn
+
+    # транзакция с блокировкой на запись с самого начала (атомарное чтение-изменение-запись)
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
@@ -0,0 +1,149 @@
+import hashlib
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decouple import config
+from postmanager.imaging import process_image
+
+
+# подготовка изображений под ограничения площадок в пуле процессов;
+# результат кэшируется на диске по (хэш содержимого, профиль площадки),
+# размер кэша ограничен: давно не использованные файлы удаляются (lru по mtime)
+class MediaPreprocessService:
+    IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.heic'}
+    CHUNK_SIZE = 1024 * 1024
+    # недавно использованные файлы не вытесняются: они могут отправляться прямо сейчас
+    CACHE_MIN_AGE = 3600
+
+    # профили площадок: максимальная сторона и качество jpeg
+    PROFILES = {
+        'telegram': {'max_side': 2560, 'quality': 87},
+        'vk': {'max_side': 2560, 'quality': 90},
+    }
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None or cls._instance._pid != os.getpid():
+            cls._instance = super().__new__(cls)
+            cls._instance._init_pool()
+        return cls._instance
+
+    def _init_pool(self):
+        self._pid = os.getpid()
+        self.enabled = config('MEDIA_PREPROCESS', default=True, cast=bool)
+        self.cache_dir = config('MEDIA_CACHE_DIR', default=os.path.join('temp', 'media_cache'))
+        self.cache_max_bytes = config('MEDIA_CACHE_MAX_MB', default=1024, cast=int) * 1024 * 1024
+        self._executor = None
+
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            print("Pillow не установлен, изображения отправляются без обработки")
+            self.enabled = False
+
+    # пул создается при первой обработке; spawn, так как в процессе работают потоки
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=config('MEDIA_PROCESS_WORKERS', default=2, cast=int),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return self._executor
+
+    @classmethod
+    def _file_digest(cls, path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(cls.CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # пути к подготовленным файлам для каждого профиля {профиль: [пути]};
+    # не изображения и файлы с ошибкой обработки остаются исходными
+    def prepare(self, paths: list, profiles: list[str]) -> dict:
+        prepared = {profile: list(paths or []) for profile in profiles}
+        if not self.enabled or not paths:
+            return prepared
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        futures = {}
+
+        for index, path in enumerate(paths):
+            if os.path.splitext(path)[1].lower() not in self.IMAGE_EXTENSIONS:
+                continue
+
+            try:
+                digest = self._file_digest(path)
+            except OSError as e:
+                print(f"Ошибка чтения вложения {path}: {e}")
+                continue
+
+            for profile in profiles:
+                settings = self.PROFILES[profile]
+                cached = self._cached_path(digest, profile)
+
+                if cached:
+                    prepared[profile][index] = cached
+                    self._touch(cached)
+                    continue
+
+                futures[(profile, index)] = self._pool().submit(
+                    process_image, path, os.path.join(self.cache_dir, f'{digest}_{profile}'),
+                    settings['max_side'], settings['quality']
+                )
+
+        for (profile, index), future in futures.items():
+            try:
+                prepared[profile][index] = future.result()
+            except Exception as e:
+                print(f"Ошибка обработки изображения {paths[index]}: {e}")
+
+        if futures:
+            self._evict()
+
+        return prepared
+
+    # готовый результат из кэша (jpg или png с прозрачностью)
+    def _cached_path(self, digest: str, profile: str) -> str | None:
+        for ext in ('.jpg', '.png'):
+            path = os.path.join(self.cache_dir, f'{digest}_{profile}{ext}')
+            if os.path.exists(path):
+                return path
+        return None
+
+    # отметка использования файла кэша для lru
+    @staticmethod
+    def _touch(path: str):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    # удаление самых давно использованных файлов, пока кэш больше лимита
+    def _evict(self):
+        try:
+            entries = []
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError as e:
+            print(f"Ошибка чтения кэша изображений: {e}")
+            return
+
+        total = sum(size for _, size, _ in entries)
+        deadline = time.time() - self.CACHE_MIN_AGE
+
+        for mtime, size, path in sorted(entries):
+            if total <= self.cache_max_bytes or mtime > deadline:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                total -= size
+            except OSError as e:
+                print(f"Ошибка удаления файла кэша {path}: {e}")
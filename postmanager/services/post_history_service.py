@@ -0,0 +1,81 @@
+import json
+from datetime import datetime
+from decouple import config
+from .local_store_service import LocalStoreService
+
+
+# история публикаций пользователя в локальной sqlite: вставка одной строкой,
+# чтение страницами по индексу (uid, id) с курсором по id
+class PostHistoryService:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            uid TEXT NOT NULL,
+            text TEXT NOT NULL,
+            vk_groups TEXT NOT NULL,
+            tg_channels TEXT NOT NULL,
+            scheduled_time TEXT,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS posts_uid_id ON posts (uid, id DESC);
+    '''
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_store()
+        return cls._instance
+
+    def _init_store(self):
+        self.store = LocalStoreService('post_history', self.SCHEMA)
+        self.max_page_size = config('POST_HISTORY_MAX_PAGE_SIZE', default=50, cast=int)
+
+    # добавление записи, возвращает ее id
+    def add(self, uid: str, post_data: dict) -> int:
+        cursor = self.store.connection().execute(
+            'INSERT INTO posts (uid, text, vk_groups, tg_channels, scheduled_time, status, created_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (
+                uid,
+                post_data.get('text', ''),
+                json.dumps(post_data.get('vk_groups', []), ensure_ascii=False),
+                json.dumps(post_data.get('tg_channels', []), ensure_ascii=False),
+                post_data.get('scheduled_time'),
+                post_data.get('status') or ('scheduled' if post_data.get('scheduled_time') else 'published'),
+                datetime.now().isoformat(),
+            )
+        )
+        return cursor.lastrowid
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        return {
+            'id': row['id'],
+            'text': row['text'],
+            'vk_groups': json.loads(row['vk_groups']),
+            'tg_channels': json.loads(row['tg_channels']),
+            'scheduled_time': row['scheduled_time'],
+            'created_at': row['created_at'],
+            'status': row['status'],
+        }
+
+    # страница истории от новых к старым; before - id последней записи
+    # предыдущей страницы, возвращает (записи, курсор следующей страницы или None)
+    def page(self, uid: str, limit: int = 20, before: int = None) -> tuple[list, int | None]:
+        limit = max(1, min(limit, self.max_page_size))
+
+        if before is None:
+            rows = self.store.connection().execute(
+                'SELECT * FROM posts WHERE uid = ? ORDER BY id DESC LIMIT ?', (uid, limit + 1)
+            ).fetchall()
+        else:
+            rows = self.store.connection().execute(
+                'SELECT * FROM posts WHERE uid = ? AND id < ? ORDER BY id DESC LIMIT ?', (uid, before, limit + 1)
+            ).fetchall()
+
+        posts = [self._to_dict(row) for row in rows[:limit]]
+        next_cursor = posts[-1]['id'] if len(rows) > limit else None
+        return posts, next_cursor
@@ -1,13 +1,22 @@
 import asyncio
 import vk_api
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import Future
 from dataclasses import dataclass
-from telethon import TelegramClient
-from telethon.sessions import StringSession
 from decouple import config
-from google.cloud.firestore import SERVER_TIMESTAMP
+from google.cloud.firestore import DELETE_FIELD, SERVER_TIMESTAMP
+from google.cloud.firestore_v1.field_path import FieldPath
 from .firebase_service import FirebaseService
 from .vk_service import VKService
+from .vk_media_service import VKMediaService
 from .telegram_service import TelegramService
+from .fanout_service import FanoutService, FanoutTask
+from .profile_service import ProfileService, UserProfile
+from .rate_limit_service import RateLimitService
+from .attachment_service import AttachmentService
+from .media_preprocess_service import MediaPreprocessService
+from .post_history_service import PostHistoryService
+from .stats_service import StatsService
 
 
 @dataclass
@@ -17,18 +26,53 @@ class PostResult:
     group_id: str
     post_id: str = None
     error: str = None
+    # через сколько секунд можно повторить (лимит запросов площадки)
+    retry_after: float = None
 
 
 # сервис публикации постов
 class PostService:
+    # поля запланированного поста, нужные планировщику для публикации
+    DUE_POST_FIELDS = ['uid', 'text', 'vk_groups', 'tg_channels', 'attachments', 'attachment_ids', 'scheduled_at']
+
     def __init__(self):
         self.firebase = FirebaseService()
         self.vk_service = VKService()
+        self.vk_media = VKMediaService()
         self.tg_service = TelegramService()
+        self.fanout = FanoutService()
+        self.profiles = ProfileService()
+        self.vk_batch = config('VK_BATCH_EXECUTE', default=True, cast=bool)
+        self.rate_limiter = RateLimitService()
+        self.attachments = AttachmentService()
+        self.media = MediaPreprocessService()
+        self.history = PostHistoryService()
+        self.stats = StatsService()
+        self.vk_flood_backoff = config('VK_FLOOD_BACKOFF', default=600, cast=int)
+
+    # результат для цели, отложенной из-за лимита запросов
+    @staticmethod
+    def _deferred_result(platform: str, group_id: str, retry_after: float) -> PostResult:
+        return PostResult(
+            success=False,
+            platform=platform,
+            group_id=group_id,
+            error=f'превышен лимит запросов, повтор через {int(retry_after) + 1} сек',
+            retry_after=retry_after
+        )
+
+    # число вызовов api vk на публикацию: wall.post и по два на вложение
+    @staticmethod
+    def _vk_call_count(attachments: list = None) -> int:
+        return 1 + 2 * len(attachments or [])
 
     # публикация поста в vk группу
     def publish_to_vk(self, access_token: str, group_id: str, text: str,
                       attachments: list = None) -> PostResult:
+        wait = self.rate_limiter.acquire('vk', access_token, self._vk_call_count(attachments))
+        if wait:
+            return self._deferred_result('vk', group_id, wait)
+
         try:
             vk_session = vk_api.VkApi(token=access_token)
             vk = vk_session.get_api()
@@ -40,6 +84,12 @@ class PostService:
                 'message': text,
             }
 
+            # загрузка вложений на стену группы
+            if attachments:
+                post_params['attachments'] = ','.join(
+                    self.vk_media.prepare(vk, access_token, group_id, attachments)
+                )
+
             response = vk.wall.post(**post_params)
 
             return PostResult(
@@ -49,6 +99,18 @@ class PostService:
                 post_id=str(response.get('post_id', ''))
             )
 
+        except vk_api.exceptions.ApiError as e:
+            # flood control: токен блокируется, цель откладывается
+            if e.code == 9:
+                self.rate_limiter.block('vk', access_token, self.vk_flood_backoff)
+                return self._deferred_result('vk', group_id, self.vk_flood_backoff)
+            return PostResult(
+                success=False,
+                platform='vk',
+                group_id=group_id,
+                error=str(e)
+            )
+
         except Exception as e:
             return PostResult(
                 success=False,
@@ -57,15 +119,122 @@ class PostService:
                 error=str(e)
             )
 
+    # пакетная публикация в несколько vk групп с общим токеном:
+    # vk_api.VkRequestsPool собирает wall.post в вызовы execute по 25 штук
+    def publish_to_vk_batch(self, access_token: str, group_ids: list[str], text: str,
+                            attachments: list = None) -> list[PostResult]:
+        results = {}
+
+        # вызовы execute (по 25 wall.post) и загрузка вложений в каждую группу
+        calls_count = -(-len(group_ids) // 25) + 2 * len(attachments or []) * len(group_ids)
+        wait = self.rate_limiter.acquire('vk', access_token, calls_count)
+        if wait:
+            return [self._deferred_result('vk', group_id, wait) for group_id in group_ids]
+
+        try:
+            vk_session = vk_api.VkApi(token=access_token)
+            vk = vk_session.get_api()
+
+            # вложения загружаются на стену каждой группы, группы готовятся параллельно
+            prepared = self.vk_media.prepare_many(vk, access_token, group_ids, attachments) if attachments else {}
+
+            # параметры поста для каждой группы
+            post_params = {}
+            for group_id in group_ids:
+                params = {
+                    'owner_id': f'-{group_id}',
+                    'from_group': 1,
+                    'message': text,
+                }
+
+                group_attachments = prepared.get(group_id)
+                if isinstance(group_attachments, Exception):
+                    results[group_id] = PostResult(
+                        success=False,
+                        platform='vk',
+                        group_id=group_id,
+                        error=str(group_attachments)
+                    )
+                    continue
+                if group_attachments:
+                    params['attachments'] = ','.join(group_attachments)
+
+                post_params[group_id] = params
+
+            with vk_api.VkRequestsPool(vk_session) as pool:
+                calls = {
+                    group_id: pool.method('wall.post', params)
+                    for group_id, params in post_params.items()
+                }
+
+            # разбор результатов execute по группам
+            for group_id, call in calls.items():
+                if call.ok:
+                    results[group_id] = PostResult(
+                        success=True,
+                        platform='vk',
+                        group_id=group_id,
+                        post_id=str(call.result.get('post_id', ''))
+                    )
+                elif isinstance(call.error, dict) and call.error.get('error_code') == 9:
+                    self.rate_limiter.block('vk', access_token, self.vk_flood_backoff)
+                    results[group_id] = self._deferred_result('vk', group_id, self.vk_flood_backoff)
+                else:
+                    error = call.error or {}
+                    results[group_id] = PostResult(
+                        success=False,
+                        platform='vk',
+                        group_id=group_id,
+                        error=error.get('error_msg', str(error)) if isinstance(error, dict) else str(error)
+                    )
+
+        except Exception as e:
+            for group_id in group_ids:
+                results.setdefault(group_id, PostResult(
+                    success=False,
+                    platform='vk',
+                    group_id=group_id,
+                    error=str(e)
+                ))
+
+        return [results[group_id] for group_id in group_ids]
+
     # публикация поста в tg канал
     def publish_to_telegram(
             self,
             session_string: str,
             channel_id: str,
             text: str,
-            attachments: list = None
+            attachments: list = None,
+            uploaded: Future = None
     ) -> PostResult:
-        result = self.tg_service.publish(session_string, channel_id, text, attachments)
+        wait = self.rate_limiter.acquire('telegram', session_string)
+        if wait:
+            return self._deferred_result('telegram', channel_id, wait)
+
+        result = self.tg_service.publish(session_string, channel_id, text, attachments, uploaded)
+        return self._telegram_result(session_string, channel_id, result)
+
+    async def apublish_to_telegram(
+            self,
+            session_string: str,
+            channel_id: str,
+            text: str,
+            attachments: list = None,
+            uploaded: Future = None
+    ) -> PostResult:
+        wait = await self.rate_limiter.aacquire('telegram', session_string)
+        if wait:
+            return self._deferred_result('telegram', channel_id, wait)
+
+        result = await self.tg_service.apublish(session_string, channel_id, text, attachments, uploaded)
+        return self._telegram_result(session_string, channel_id, result)
+
+    # результат публикации в tg; FloodWait блокирует сессию на время, указанное сервером
+    def _telegram_result(self, session_string: str, channel_id: str, result: dict) -> PostResult:
+        if result.get('retry_after'):
+            self.rate_limiter.block('telegram', session_string, result['retry_after'])
+            return self._deferred_result('telegram', channel_id, result['retry_after'])
 
         if result['success']:
             return PostResult(
@@ -89,86 +258,268 @@ class PostService:
             text: str,
             vk_groups: list[str],
             tg_channels: list[str],
-            attachments: list = None
+            attachments: list = None,
+            profile: UserProfile = None
+    ) -> dict:
+        # документ пользователя читается один раз на всю публикацию
+        if profile is None:
+            profile = self.profiles.load(uid)
+
+        prepared = self._prepare_attachments(attachments, vk_groups, tg_channels)
+        tasks, slots, tg_connected = self._plan_publish(
+            profile, text, vk_groups, tg_channels, prepared, self.publish_to_telegram
+        )
+
+        # одновременная отправка во все группы/каналы
+        outputs = self.fanout.run(tasks)
+
+        return self._merge_results(slots, outputs, tg_connected)
+
+    # то же для async views: профиль читается async клиентом firestore,
+    # публикация в tg ожидается в текущем loop без занятого потока
+    async def apublish_post(
+            self,
+            uid: str,
+            text: str,
+            vk_groups: list[str],
+            tg_channels: list[str],
+            attachments: list = None,
+            profile: UserProfile = None
     ) -> dict:
+        if profile is None:
+            profile = await self.profiles.aload(uid)
+
+        prepared = await asyncio.to_thread(self._prepare_attachments, attachments, vk_groups, tg_channels)
+        tasks, slots, tg_connected = self._plan_publish(
+            profile, text, vk_groups, tg_channels, prepared, self.apublish_to_telegram
+        )
+
+        outputs = await self.fanout.arun(tasks)
+
+        return self._merge_results(slots, outputs, tg_connected)
+
+    # результаты публикации по целям (PostResult) по мере их готовности
+    def iter_publish_results(
+            self,
+            uid: str,
+            text: str,
+            vk_groups: list[str],
+            tg_channels: list[str],
+            attachments: list = None,
+            profile: UserProfile = None
+    ):
+        if profile is None:
+            profile = self.profiles.load(uid)
+
+        prepared = self._prepare_attachments(attachments, vk_groups, tg_channels)
+        tasks, slots, tg_connected = self._plan_publish(
+            profile, text, vk_groups, tg_channels, prepared, self.publish_to_telegram
+        )
+
+        yield from self._immediate_results(slots, tg_connected, tg_channels)
+
+        # пакетная задача vk возвращает список результатов по группам
+        for _, output in self.fanout.iter_results(tasks):
+            yield from output if isinstance(output, list) else [output]
+
+    # то же для async views (потоковая отдача результатов)
+    async def aiter_publish_results(
+            self,
+            uid: str,
+            text: str,
+            vk_groups: list[str],
+            tg_channels: list[str],
+            attachments: list = None,
+            profile: UserProfile = None
+    ):
+        if profile is None:
+            profile = await self.profiles.aload(uid)
+
+        prepared = await asyncio.to_thread(self._prepare_attachments, attachments, vk_groups, tg_channels)
+        tasks, slots, tg_connected = self._plan_publish(
+            profile, text, vk_groups, tg_channels, prepared, self.apublish_to_telegram
+        )
+
+        for result in self._immediate_results(slots, tg_connected, tg_channels):
+            yield result
+
+        async for _, output in self.fanout.aiter_results(tasks):
+            for result in output if isinstance(output, list) else [output]:
+                yield result
+
+    # результаты целей, которые завершаются без публикации: нет токена группы или tg не подключен
+    @staticmethod
+    def _immediate_results(slots: list, tg_connected: bool, tg_channels: list[str]) -> list[PostResult]:
+        results = [slot for slot in slots if isinstance(slot, PostResult)]
+
+        if not tg_connected:
+            results.extend(
+                PostResult(
+                    success=False,
+                    platform='telegram',
+                    group_id=channel_id,
+                    error='Telegram не подключен'
+                )
+                for channel_id in tg_channels
+            )
+
+        return results
+
+    # изображения подготавливаются под ограничения каждой площадки {площадка: пути}
+    def _prepare_attachments(self, attachments: list, vk_groups: list, tg_channels: list) -> dict:
+        profiles = [name for name, targets in (('vk', vk_groups), ('telegram', tg_channels)) if targets]
+        prepared = self.media.prepare(attachments, profiles)
+        return {
+            'vk': prepared.get('vk', attachments),
+            'telegram': prepared.get('telegram', attachments),
+        }
+
+    # задачи fanout и слоты целей: для каждой цели (номер задачи, позиция
+    # в пакетном результате) или готовый результат с ошибкой
+    def _plan_publish(
+            self,
+            profile: UserProfile,
+            text: str,
+            vk_groups: list[str],
+            tg_channels: list[str],
+            prepared: dict,
+            publish_to_telegram
+    ) -> tuple[list, list, bool]:
+        vk_attachments = prepared['vk']
+        tg_attachments = prepared['telegram']
+
+        tasks = []
+        slots = []
+        tg_connected = True
+
+        # цели vk группируются по токену
+        vk_targets = {}
+        for group_id in vk_groups or []:
+            # получение токена группы
+            group_token = profile.vk_group_token(group_id)
+
+            if not group_token:
+                slots.append(PostResult(
+                    success=False,
+                    platform='vk',
+                    group_id=group_id,
+                    error='не найден токен доступа группы'
+                ))
+                continue
+
+            vk_targets.setdefault(group_token, []).append((len(slots), group_id))
+            slots.append(None)
+
+        # задачи публикации в vk
+        for group_token, targets in vk_targets.items():
+            if self.vk_batch and len(targets) > 1:
+                tasks.append(FanoutTask(
+                    platform='vk',
+                    account=group_token,
+                    func=self.publish_to_vk_batch,
+                    args=(group_token, [group_id for _, group_id in targets], text, vk_attachments)
+                ))
+                for position, (slot, _) in enumerate(targets):
+                    slots[slot] = (len(tasks) - 1, position)
+            else:
+                for slot, group_id in targets:
+                    tasks.append(FanoutTask(
+                        platform='vk',
+                        account=group_token,
+                        func=self.publish_to_vk,
+                        args=(group_token, group_id, text, vk_attachments)
+                    ))
+                    slots[slot] = (len(tasks) - 1, None)
+
+        # задачи публикации в tg
+        if tg_channels:
+            session_string = profile.tg_session
+
+            if not session_string:
+                tg_connected = False
+            else:
+                # вложения загружаются в tg один раз и переиспользуются всеми каналами
+                uploaded = None
+                if tg_attachments:
+                    uploaded = self.tg_service.upload_attachments(session_string, tg_attachments)
+
+                for channel_id in tg_channels:
+                    tasks.append(FanoutTask(
+                        platform='telegram',
+                        account=session_string,
+                        func=publish_to_telegram,
+                        args=(session_string, channel_id, text, tg_attachments, uploaded)
+                    ))
+                    slots.append((len(tasks) - 1, None))
+
+        return tasks, slots, tg_connected
+
+    # общий ответ по результатам целей
+    def collect_results(self, post_results: list[PostResult]) -> dict:
         results = {
             'vk': [],
             'telegram': [],
             'success': True,
-            'errors': []
+            'errors': [],
+            # цели, отложенные из-за лимитов площадки (PostResult с retry_after)
+            'deferred': []
         }
 
-        # публикация в vk
-        if vk_groups:
-            for group_id in vk_groups:
-                # получение токена группы
-                group_token = self.get_vk_group_token(uid, group_id)
-
-                if not group_token:
-                    results['vk'].append(PostResult(
-                        success=False,
-                        platform='vk',
-                        group_id=group_id,
-                        error='не найден токен доступа группы'
-                    ))
-                    results['success'] = False
-                    results['errors'].append(f"VK группа {group_id}: не найден токен доступа")
-                    continue
-
-                result = self.publish_to_vk(group_token, group_id, text, attachments)
-                results['vk'].append(result)
+        for result in post_results:
+            self._collect_result(results, result)
 
-                if not result.success:
-                    results['success'] = False
-                    results['errors'].append(f"VK группа {group_id}: {result.error}")
+        return results
 
-        # публикация в tg
-        if tg_channels:
-            tg_account = self.tg_service.get_account(uid)
+    # сборка общего ответа из результатов задач в порядке целей
+    def _merge_results(self, slots: list, outputs: list, tg_connected: bool) -> dict:
+        post_results = []
 
-            if not tg_account:
-                results['errors'].append("Telegram не подключен")
-                results['success'] = False
+        for slot in slots:
+            if isinstance(slot, PostResult):
+                post_results.append(slot)
             else:
-                session_string = tg_account.get('session_string')
+                index, position = slot
+                post_results.append(outputs[index] if position is None else outputs[index][position])
 
-                for channel_id in tg_channels:
-                    result = self.publish_to_telegram(session_string, channel_id, text, attachments)
-                    results['telegram'].append(result)
+        results = self.collect_results(post_results)
 
-                    if not result.success:
-                        results['success'] = False
-                        results['errors'].append(f"Telegram канал {channel_id}: {result.error}")
+        if not tg_connected:
+            results['errors'].append("Telegram не подключен")
+            results['success'] = False
 
         return results
 
-    # сохранение токена vk группы
+    # учет результата публикации в общем ответе
+    @staticmethod
+    def _collect_result(results: dict, result: PostResult):
+        results[result.platform].append(result)
+
+        if not result.success:
+            results['success'] = False
+            if result.retry_after:
+                results['deferred'].append(result)
+            elif result.platform == 'vk':
+                results['errors'].append(f"VK группа {result.group_id}: {result.error}")
+            else:
+                results['errors'].append(f"Telegram канал {result.group_id}: {result.error}")
+
+    # сохранение токена vk группы: одна запись только этой группы
+    # (документ создается, если его нет; остальные группы не перезаписываются)
     def save_vk_group_token(self, uid: str, group_id: str, group_token: str) -> bool:
         try:
             doc_ref = self.firebase.db.collection('users').document(uid)
-            doc = doc_ref.get()
 
-            # создание документа
-            if not doc.exists:
-                doc_ref.set({
-                    'uid': uid,
-                    'vk_groups': {}
-                })
-
-            # получение текущих групп
-            data = doc_ref.get().to_dict()
-            vk_groups = data.get('vk_groups', {})
-
-            # сохранение токена группы
-            vk_groups[group_id] = {
-                'token': group_token,
-                'added_at': SERVER_TIMESTAMP
-            }
-
-            doc_ref.update({
-                'vk_groups': vk_groups
-            })
+            doc_ref.set({
+                'uid': uid,
+                'vk_groups': {
+                    group_id: {
+                        'token': group_token,
+                        'added_at': SERVER_TIMESTAMP
+                    }
+                }
+            }, merge=True)
 
+            self.profiles.invalidate(uid)
             return True
 
         except Exception as e:
@@ -178,78 +529,42 @@ class PostService:
     # получение токена vk группы
     def get_vk_group_token(self, uid: str, group_id: str) -> str | None:
         try:
-            doc = self.firebase.db.collection('users').document(uid).get()
-
-            if not doc.exists:
-                return None
-
-            data = doc.to_dict()
-            vk_groups = data.get('vk_groups', {})
-
-            group_data = vk_groups.get(group_id)
-            return group_data.get('token') if group_data else None
-
+            return self.profiles.load(uid).vk_group_token(group_id)
         except Exception:
             return None
 
-    # удаление токена vk группы
+    # удаление токена vk группы: удаление одного поля по пути vk_groups.<id>
+    # (без документа update завершается ошибкой и возвращается False)
     def remove_vk_group_token(self, uid: str, group_id: str) -> bool:
         try:
             doc_ref = self.firebase.db.collection('users').document(uid)
-            doc = doc_ref.get()
-
-            if not doc.exists:
-                return False
-
-            data = doc.to_dict()
-            vk_groups = data.get('vk_groups', {})
 
-            if group_id in vk_groups:
-                del vk_groups[group_id]
-                doc_ref.update({
-                    'vk_groups': vk_groups
-                })
+            doc_ref.update({
+                FieldPath('vk_groups', group_id).to_api_repr(): DELETE_FIELD
+            })
 
+            self.profiles.invalidate(uid)
             return True
 
         except Exception:
             return False
 
-    # сохранение tg канала
+    # сохранение tg канала: одна запись только этого канала
     def save_tg_channel(self, uid: str, channel_id: str, channel_name: str = None) -> bool:
         try:
-            from google.cloud.firestore_v1 import SERVER_TIMESTAMP
-
             doc_ref = self.firebase.db.collection('users').document(uid)
-            doc = doc_ref.get()
 
-            # создание документа
-            if not doc.exists:
-                doc_ref.set({
-                    'uid': uid,
-                    'tg_channels': {
-                        channel_id: {
-                            'name': channel_name or channel_id,
-                            'added_at': SERVER_TIMESTAMP
-                        }
+            doc_ref.set({
+                'uid': uid,
+                'tg_channels': {
+                    channel_id: {
+                        'name': channel_name or channel_id,
+                        'added_at': SERVER_TIMESTAMP
                     }
-                })
-                return True
-
-            # получение текущих каналов
-            data = doc.to_dict()
-            tg_channels = data.get('tg_channels', {})
-
-            # сохранение канала
-            tg_channels[channel_id] = {
-                'name': channel_name or channel_id,
-                'added_at': SERVER_TIMESTAMP
-            }
-
-            doc_ref.update({
-                'tg_channels': tg_channels
-            })
+                }
+            }, merge=True)
 
+            self.profiles.invalidate(uid)
             return True
 
         except Exception as e:
@@ -261,35 +576,21 @@ class PostService:
     # получение списка tg каналов
     def get_tg_channels(self, uid: str) -> dict:
         try:
-            doc = self.firebase.db.collection('users').document(uid).get()
-
-            if not doc.exists:
-                return {}
-
-            data = doc.to_dict()
-            return data.get('tg_channels', {})
-
+            return self.profiles.load(uid).tg_channels
         except Exception:
             return {}
 
-    # удаление tg канала
+    # удаление tg канала: удаление одного поля по пути tg_channels.<id>
+    # (id каналов вида -100... экранируются FieldPath)
     def remove_tg_channel(self, uid: str, channel_id: str) -> bool:
         try:
             doc_ref = self.firebase.db.collection('users').document(uid)
-            doc = doc_ref.get()
-
-            if not doc.exists:
-                return False
 
-            data = doc.to_dict()
-            tg_channels = data.get('tg_channels', {})
-
-            if channel_id in tg_channels:
-                del tg_channels[channel_id]
-                doc_ref.update({
-                    'tg_channels': tg_channels
-                })
+            doc_ref.update({
+                FieldPath('tg_channels', channel_id).to_api_repr(): DELETE_FIELD
+            })
 
+            self.profiles.invalidate(uid)
             return True
 
         except Exception:
@@ -298,14 +599,7 @@ class PostService:
     # получение списка vk групп
     def get_vk_groups(self, uid: str) -> dict:
         try:
-            doc = self.firebase.db.collection('users').document(uid).get()
-
-            if not doc.exists:
-                return {}
-
-            data = doc.to_dict()
-            return data.get('vk_groups', {})
-
+            return self.profiles.load(uid).vk_groups
         except Exception:
             return {}
 
@@ -317,7 +611,9 @@ class PostService:
             vk_groups: list[str],
             tg_channels: list[str],
             scheduled_time: str,
-            attachments: list = None
+            attachments: list = None,
+            attachment_ids: list = None,
+            deferred: bool = False
     ) -> str | None:
         try:
             from google.cloud.firestore_v1 import SERVER_TIMESTAMP
@@ -329,9 +625,14 @@ class PostService:
                 'vk_groups': vk_groups,
                 'tg_channels': tg_channels,
                 'scheduled_time': scheduled_time,
+                'scheduled_at': self.parse_scheduled_time(scheduled_time),
                 'created_at': SERVER_TIMESTAMP,
                 'status': 'pending',
-                'attachments': attachments or []
+                'attachments': attachments or [],
+                # id блобов в хранилище вложений (ссылки учитываются вызывающим)
+                'attachment_ids': attachment_ids or [],
+                # пост с целями, перенесенными из другого поста (статистика учитывает его отдельно)
+                'deferred': deferred
             }
 
             # сохранение в коллекцию
@@ -345,17 +646,221 @@ class PostService:
             traceback.print_exc()
             return None
 
-    # получение всех запланированных постов всех пользователей
-    def get_all_pending_posts(self) -> list:
+    # перенос целей, отложенных из-за лимитов площадки, в новый запланированный пост
+    # на время, указанное площадкой; пост берет свои ссылки на вложения
+    def defer_targets(self, uid: str, text: str, deferred: list[PostResult],
+                      attachments: list = None, attachment_ids: list = None) -> str | None:
+        retry_at = datetime.now(timezone.utc) + timedelta(seconds=max(r.retry_after for r in deferred))
+
+        deferred_post_id = self.save_scheduled_post(
+            uid=uid,
+            text=text,
+            vk_groups=[r.group_id for r in deferred if r.platform == 'vk'],
+            tg_channels=[r.group_id for r in deferred if r.platform == 'telegram'],
+            scheduled_time=retry_at.isoformat(),
+            attachments=attachments or None,
+            attachment_ids=attachment_ids or None,
+            deferred=True,
+        )
+
+        if deferred_post_id:
+            self.stats.record(uid, 'deferred')
+            if attachment_ids:
+                self.attachments.retain(attachment_ids)
+        return deferred_post_id
+
+    # время публикации в utc из iso строки (без зоны считается utc)
+    @staticmethod
+    def parse_scheduled_time(scheduled_time: str) -> datetime:
+        scheduled_dt = datetime.fromisoformat(scheduled_time.replace('Z', '+00:00'))
+        if scheduled_dt.tzinfo is None:
+            scheduled_dt = scheduled_dt.replace(tzinfo=timezone.utc)
+        return scheduled_dt.astimezone(timezone.utc)
+
+    # запрос ожидающих постов с временем публикации не позже until
+    def pending_posts_query(self, until: datetime):
+        return self.firebase.db.collection('scheduled_posts') \
+            .where('status', '==', 'pending') \
+            .where('scheduled_at', '<=', until) \
+            .order_by('scheduled_at')
+
+    # страницы постов, время которых наступило: диапазонный запрос по индексу
+    # (status, scheduled_at) с курсором, читаются только нужные для публикации поля
+    def iter_due_post_pages(self, now: datetime = None, page_size: int = 100, max_posts: int = None):
+        now = now or datetime.now(timezone.utc)
+        query = self.pending_posts_query(now).select(self.DUE_POST_FIELDS)
+
+        last_snapshot = None
+        fetched = 0
+
+        while max_posts is None or fetched < max_posts:
+            limit = page_size if max_posts is None else min(page_size, max_posts - fetched)
+            page_query = query.limit(limit)
+            if last_snapshot is not None:
+                page_query = page_query.start_after(last_snapshot)
+
+            page = []
+            for snapshot in page_query.stream():
+                last_snapshot = snapshot
+                page.append({'id': snapshot.id, **snapshot.to_dict()})
+
+            if page:
+                fetched += len(page)
+                yield page
+
+            if len(page) < limit:
+                return
+
+    # посты, захваченные воркерами, аренда которых истекла (воркер упал или завис)
+    def get_expired_claims(self, now: datetime = None, limit: int = 100) -> list:
+        now = now or datetime.now(timezone.utc)
+
         try:
             posts = self.firebase.db.collection('scheduled_posts') \
-                .where('status', '==', 'pending') \
+                .where('status', '==', 'claimed') \
+                .where('lease_expires_at', '<=', now) \
+                .order_by('lease_expires_at') \
+                .select(self.DUE_POST_FIELDS) \
+                .limit(limit) \
                 .stream()
             return [{'id': p.id, **p.to_dict()} for p in posts]
         except Exception as e:
-            print(f"Ошибка получения запланированных постов: {e}")
+            print(f"Ошибка получения просроченных захватов: {e}")
             return []
 
+    # захват поста воркером в транзакции: пост в статусе pending или с истекшей арендой
+    # переходит в claimed с id воркера и сроком аренды, иначе возвращается None
+    def claim_scheduled_post(self, post_id: str, worker_id: str, lease_seconds: int) -> dict | None:
+        from google.cloud.firestore_v1 import SERVER_TIMESTAMP, Increment, transactional
+
+        db = self.firebase.db
+        doc_ref = db.collection('scheduled_posts').document(post_id)
+
+        @transactional
+        def claim(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+
+            data = snapshot.to_dict()
+            now = datetime.now(timezone.utc)
+            lease_expires_at = data.get('lease_expires_at')
+
+            claimable = data.get('status') == 'pending' or (
+                data.get('status') == 'claimed' and lease_expires_at and lease_expires_at <= now
+            )
+            if not claimable:
+                return None
+
+            transaction.update(doc_ref, {
+                'status': 'claimed',
+                'worker_id': worker_id,
+                'lease_expires_at': now + timedelta(seconds=lease_seconds),
+                'claimed_at': SERVER_TIMESTAMP,
+                'attempts': Increment(1),
+            })
+            return {'id': post_id, **data}
+
+        try:
+            return claim(db.transaction())
+        except Exception as e:
+            print(f"Ошибка захвата поста {post_id}: {e}")
+            return None
+
+    # продление аренды захваченного поста; False, если пост больше не принадлежит воркеру
+    def renew_claim(self, post_id: str, worker_id: str, lease_seconds: int) -> bool:
+        from google.cloud.firestore_v1 import transactional
+
+        db = self.firebase.db
+        doc_ref = db.collection('scheduled_posts').document(post_id)
+
+        @transactional
+        def renew(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+
+            data = snapshot.to_dict()
+            if data.get('status') != 'claimed' or data.get('worker_id') != worker_id:
+                return False
+
+            transaction.update(doc_ref, {
+                'lease_expires_at': datetime.now(timezone.utc) + timedelta(seconds=lease_seconds),
+            })
+            return True
+
+        return renew(db.transaction())
+
+    # итоговый статус захваченного поста, только если аренда все еще у этого воркера
+    def finish_claimed_post(self, post_id: str, worker_id: str, status: str, error: str = None) -> bool:
+        from google.cloud.firestore_v1 import DELETE_FIELD, SERVER_TIMESTAMP, transactional
+
+        db = self.firebase.db
+        doc_ref = db.collection('scheduled_posts').document(post_id)
+
+        @transactional
+        def finish(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+
+            data = snapshot.to_dict()
+            if data.get('status') != 'claimed' or data.get('worker_id') != worker_id:
+                return False
+
+            update_data = {
+                'status': status,
+                'updated_at': SERVER_TIMESTAMP,
+                'lease_expires_at': DELETE_FIELD,
+            }
+            if error:
+                update_data['error'] = error
+
+            transaction.update(doc_ref, update_data)
+            return True
+
+        try:
+            return finish(db.transaction())
+        except Exception as e:
+            print(f"Ошибка обновления статуса поста {post_id}: {e}")
+            return False
+
+    # заполнение scheduled_at у ожидающих постов, созданных до его появления
+    def backfill_scheduled_at(self, batch_size: int = 400) -> int:
+        posts = self.firebase.db.collection('scheduled_posts') \
+            .where('status', '==', 'pending') \
+            .select(['scheduled_time', 'scheduled_at']) \
+            .stream()
+
+        batch = self.firebase.db.batch()
+        pending_writes = 0
+        updated = 0
+
+        for post in posts:
+            data = post.to_dict()
+            if data.get('scheduled_at') or not data.get('scheduled_time'):
+                continue
+
+            try:
+                scheduled_at = self.parse_scheduled_time(data['scheduled_time'])
+            except ValueError:
+                print(f"Ошибка парсинга времени для поста {post.id}")
+                continue
+
+            batch.update(post.reference, {'scheduled_at': scheduled_at})
+            pending_writes += 1
+            updated += 1
+
+            if pending_writes >= batch_size:
+                batch.commit()
+                batch = self.firebase.db.batch()
+                pending_writes = 0
+
+        if pending_writes:
+            batch.commit()
+
+        return updated
+
     # получение запланированных постов пользователя
     def get_scheduled_posts(self, uid: str) -> list:
         try:
@@ -377,10 +882,20 @@ class PostService:
             print(f"Ошибка получения запланированных постов: {e}")
             return []
 
-    # удаление запланированного поста
+    # удаление (отмена) запланированного поста с освобождением вложений
     def delete_scheduled_post(self, post_id: str) -> bool:
         try:
-            self.firebase.db.collection('scheduled_posts').document(post_id).delete()
+            doc_ref = self.firebase.db.collection('scheduled_posts').document(post_id)
+            doc = doc_ref.get()
+            doc_ref.delete()
+
+            if doc.exists:
+                post_data = doc.to_dict()
+                self.attachments.release_many(post_data.get('attachment_ids'))
+                if post_data.get('status') in ('pending', 'claimed'):
+                    self.stats.record(
+                        post_data.get('uid'), 'deferred_cancelled' if post_data.get('deferred') else 'cancelled'
+                    )
             return True
         except Exception:
             return False
@@ -405,59 +920,34 @@ class PostService:
 
     # работа с недавними постами
     def save_recent_post(self, uid: str, post_data: dict) -> bool:
-        import json
-        import os
-        from datetime import datetime
-
         try:
-            # путь к файлу для пользователя
-            file_path = f'temp/recent_posts_{uid}.json'
-
-            # загрузка существующих путей
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    recent_posts = json.load(f)
-            else:
-                recent_posts = []
-
-            # добавление нового поста в начало
-            new_post = {
-                'text': post_data.get('text', '')[:100] + ('...' if len(post_data.get('text', '')) > 100 else ''),
-                'vk_groups': post_data.get('vk_groups', []),
-                'tg_channels': post_data.get('tg_channels', []),
-                'scheduled_time': post_data.get('scheduled_time'),
-                'created_at': datetime.now().isoformat(),
-                'status': 'scheduled' if post_data.get('scheduled_time') else 'published'
-            }
-
-            recent_posts.insert(0, new_post)
-
-            recent_posts = recent_posts[:3]
-
-            # сохранение обратно
-            os.makedirs('temp', exist_ok=True)
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(recent_posts, f, ensure_ascii=False, indent=2)
-
+            self.history.add(uid, post_data)
             return True
 
         except Exception as e:
             print(f"Ошибка сохранения недавнего поста: {e}")
             return False
 
-    def get_recent_posts(self, uid: str) -> list:
-        import json
-        import os
-
+    def get_recent_posts(self, uid: str, limit: int = 3) -> list:
         try:
-            file_path = f'temp/recent_posts_{uid}.json'
+            posts, _ = self.history.page(uid, limit)
 
-            if not os.path.exists(file_path):
-                return []
+            # в списке недавних постов текст сокращается
+            for post in posts:
+                if len(post['text']) > 100:
+                    post['text'] = post['text'][:100] + '...'
 
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return posts
 
         except Exception as e:
             print(f"Ошибка получения недавних постов: {e}")
             return []
+
+    # страница истории публикаций
+    def get_post_history(self, uid: str, limit: int = 20, before: int = None) -> tuple[list, int | None]:
+        try:
+            return self.history.page(uid, limit, before)
+
+        except Exception as e:
+            print(f"Ошибка получения истории постов: {e}")
+            return [], None
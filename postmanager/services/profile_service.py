@@ -0,0 +1,165 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import date
+from functools import cached_property
+from cachetools import TTLCache
+from decouple import config
+from .firebase_service import FirebaseService
+from .crypto_service import CryptoService
+
+
+# документ пользователя, прочитанный из firestore один раз за запрос
+@dataclass
+class UserProfile:
+    uid: str
+    data: dict = None
+
+    @property
+    def exists(self) -> bool:
+        return self.data is not None
+
+    # токены vk групп {group_id: {'token': ..., 'added_at': ...}}
+    @property
+    def vk_groups(self) -> dict:
+        return (self.data or {}).get('vk_groups', {})
+
+    # сохраненные tg каналы
+    @property
+    def tg_channels(self) -> dict:
+        return (self.data or {}).get('tg_channels', {})
+
+    # счетчики для главной страницы (ведет StatsService)
+    @property
+    def stats(self) -> dict:
+        stats = (self.data or {}).get('stats') or {}
+        today = (stats.get('daily') or {}).get(date.today().isoformat()) or {}
+
+        return {
+            'total_posts': max(stats.get('total_posts', 0), 0),
+            'scheduled': max(stats.get('scheduled', 0), 0),
+            'published_today': today.get('published', 0),
+        }
+
+    # токен vk группы
+    def vk_group_token(self, group_id: str) -> str | None:
+        group_data = self.vk_groups.get(group_id)
+        return group_data.get('token') if group_data else None
+
+    # vk аккаунт (access_token расшифровывается один раз)
+    @cached_property
+    def vk_account(self) -> dict | None:
+        return self._decrypted_account('vk_connected', 'vk_account', 'access_token')
+
+    # tg аккаунт (session_string расшифровывается один раз)
+    @cached_property
+    def tg_account(self) -> dict | None:
+        return self._decrypted_account('tg_connected', 'tg_account', 'session_string')
+
+    # расшифрованная сессия tg
+    @property
+    def tg_session(self) -> str | None:
+        return self.tg_account.get('session_string') if self.tg_account else None
+
+    # зашифрованные секреты профиля (для пакетной расшифровки)
+    def encrypted_secrets(self) -> list[str]:
+        data = self.data or {}
+        secrets = [
+            (data.get('vk_account') or {}).get('access_token'),
+            (data.get('tg_account') or {}).get('session_string'),
+        ]
+        return [secret for secret in secrets if secret]
+
+    # аккаунт с расшифрованным секретом или None, если не подключен
+    def _decrypted_account(self, flag: str, field: str, secret: str) -> dict | None:
+        data = self.data or {}
+
+        if not data.get(flag):
+            return None
+
+        account = data.get(field)
+        if not account:
+            return None
+
+        encrypted = account.get(secret)
+        if encrypted:
+            decrypted = CryptoService().decrypt(encrypted)
+            if not decrypted:
+                return None
+            account = dict(account)
+            account[secret] = decrypted
+
+        return account
+
+
+# загрузка профиля пользователя
+class ProfileService:
+    COLLECTION = 'users'
+
+    # общий для процесса кэш профилей и чтения, выполняющиеся прямо сейчас
+    _cache = TTLCache(
+        maxsize=config('PROFILE_CACHE_SIZE', default=1024, cast=int),
+        ttl=config('PROFILE_CACHE_TTL', default=60, cast=int),
+    )
+    _inflight = {}
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.firebase = FirebaseService()
+
+    # чтение документа пользователя одним запросом
+    def load(self, uid: str) -> UserProfile:
+        doc = self.firebase.db.collection(self.COLLECTION).document(uid).get()
+        return UserProfile(uid=uid, data=doc.to_dict() if doc.exists else None)
+
+    # асинхронное чтение документа пользователя
+    async def aload(self, uid: str) -> UserProfile:
+        doc = await self.firebase.async_db.collection(self.COLLECTION).document(uid).get()
+        return UserProfile(uid=uid, data=doc.to_dict() if doc.exists else None)
+
+    # одновременное чтение профилей нескольких пользователей {uid: профиль}
+    async def aload_many(self, uids: list[str]) -> dict:
+        uids = list(dict.fromkeys(uids))
+        profiles = await asyncio.gather(*(self.aload(uid) for uid in uids))
+        return dict(zip(uids, profiles))
+
+    # профиль из кэша; одновременные запросы одного uid ждут одно чтение
+    def get(self, uid: str) -> UserProfile:
+        with self._lock:
+            profile = self._cache.get(uid)
+            if profile is not None:
+                return profile
+
+            future = self._inflight.get(uid)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[uid] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            profile = self.load(uid)
+        except Exception as e:
+            with self._lock:
+                if self._inflight.get(uid) is future:
+                    del self._inflight[uid]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            # если профиль инвалидировали во время чтения, в кэш он не попадает
+            if self._inflight.get(uid) is future:
+                del self._inflight[uid]
+                self._cache[uid] = profile
+
+        future.set_result(profile)
+        return profile
+
+    # сброс кэша после изменения документа пользователя
+    def invalidate(self, uid: str):
+        with self._lock:
+            self._cache.pop(uid, None)
+            self._inflight.pop(uid, None)
@@ -0,0 +1,296 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from .local_store_service import LocalStoreService
+from .post_service import PostService
+from .stats_service import StatsService
+
+
+# фоновая публикация: задание и его цели сохраняются в локальной sqlite (outbox)
+# до ответа клиенту, затем выполняются в пуле потоков с записью прогресса по целям
+class PublishJobService:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            uid TEXT NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            summary TEXT,
+            owner TEXT,
+            lease_expires_at REAL NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires_at);
+
+        CREATE TABLE IF NOT EXISTS job_targets (
+            job_id TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            target_id TEXT NOT NULL,
+            status TEXT NOT NULL,
+            post_id TEXT,
+            error TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (job_id, platform, target_id)
+        );
+    '''
+
+    _instance = None
+
+    def __new__(cls):
+        # после fork пул потоков родителя в дочернем процессе не работает
+        if cls._instance is None or cls._instance._pid != os.getpid():
+            cls._instance = super().__new__(cls)
+            cls._instance._init_jobs()
+        return cls._instance
+
+    def _init_jobs(self):
+        self._pid = os.getpid()
+        self.store = LocalStoreService('publish_jobs', self.SCHEMA)
+        self.owner = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.lease_seconds = config('PUBLISH_JOB_LEASE_SECONDS', default=300, cast=int)
+        self._executor = ThreadPoolExecutor(
+            max_workers=config('PUBLISH_JOB_WORKERS', default=4, cast=int),
+            thread_name_prefix='publish-job',
+        )
+
+        # задания, оставшиеся от предыдущего запуска, возвращаются в работу
+        self.recover()
+
+    # создание задания (вместе со всеми целями) и постановка в очередь
+    def create(self, uid: str, text: str, vk_groups: list, tg_channels: list, attachment_ids: list = None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        payload = {
+            'text': text,
+            'vk_groups': vk_groups,
+            'tg_channels': tg_channels,
+            'attachment_ids': attachment_ids or [],
+        }
+        targets = [('vk', group_id) for group_id in vk_groups] + \
+            [('telegram', channel_id) for channel_id in tg_channels]
+
+        with self.store.transaction() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, uid, status, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, uid, 'queued', json.dumps(payload, ensure_ascii=False), now, now)
+            )
+            conn.executemany(
+                'INSERT OR IGNORE INTO job_targets (job_id, platform, target_id, status, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(job_id, platform, target_id, 'pending', now) for platform, target_id in targets]
+            )
+
+        self._executor.submit(self._run, job_id)
+        return job_id
+
+    # возврат в очередь заданий с истекшей арендой (процесс-владелец завершился)
+    def recover(self) -> int:
+        try:
+            with self.store.transaction() as conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL "
+                    "WHERE status = 'running' AND lease_expires_at < ?",
+                    (time.time(),)
+                )
+                rows = conn.execute("SELECT id FROM jobs WHERE status = 'queued'").fetchall()
+        except Exception as e:
+            print(f"Ошибка восстановления заданий публикации: {e}")
+            return 0
+
+        for row in rows:
+            self._executor.submit(self._run, row['id'])
+        return len(rows)
+
+    # захват задания этим процессом; False, если его уже взял другой
+    def _claim(self, job_id: str) -> bool:
+        now = time.time()
+        cursor = self.store.connection().execute(
+            "UPDATE jobs SET status = 'running', owner = ?, lease_expires_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (self.owner, now + self.lease_seconds, now, job_id)
+        )
+        return cursor.rowcount == 1
+
+    # продление аренды задания; False, если задание уже принадлежит другому процессу
+    def _renew(self, job_id: str, conn=None) -> bool:
+        now = time.time()
+        cursor = (conn or self.store.connection()).execute(
+            "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND owner = ? AND status = 'running'",
+            (now + self.lease_seconds, now, job_id, self.owner)
+        )
+        return cursor.rowcount == 1
+
+    # продление аренды, пока задание выполняется (долгая загрузка вложений не дает
+    # результатов целей); lost выставляется, если аренду перехватили
+    def _heartbeat(self, job_id: str, stop: threading.Event, lost: threading.Event):
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                if not self._renew(job_id):
+                    lost.set()
+                    return
+            except Exception as e:
+                print(f"Ошибка продления аренды задания {job_id}: {e}")
+
+    # результат цели; аренда задания продлевается с каждым результатом
+    def _save_target(self, job_id: str, result):
+        now = time.time()
+
+        if result.success:
+            status = 'success'
+        elif result.retry_after:
+            status = 'deferred'
+        else:
+            status = 'failed'
+
+        with self.store.transaction() as conn:
+            conn.execute(
+                'UPDATE job_targets SET status = ?, post_id = ?, error = ?, updated_at = ? '
+                'WHERE job_id = ? AND platform = ? AND target_id = ?',
+                (status, result.post_id, result.error, now, job_id, result.platform, result.group_id)
+            )
+            self._renew(job_id, conn)
+
+    # выполнение задания: публикуются только цели, еще не получившие результат
+    def _run(self, job_id: str):
+        if not self._claim(job_id):
+            return
+
+        conn = self.store.connection()
+        job = conn.execute('SELECT uid, payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        payload = json.loads(job['payload'])
+        pending = {
+            (row['platform'], row['target_id'])
+            for row in conn.execute(
+                "SELECT platform, target_id FROM job_targets WHERE job_id = ? AND status = 'pending'", (job_id,)
+            )
+        }
+
+        post_service = PostService()
+        status = 'done'
+        deferred = []
+        deferred_post_id = None
+
+        stop = threading.Event()
+        lost = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job_id, stop, lost), name=f'publish-job-lease-{job_id[:8]}', daemon=True
+        )
+        heartbeat.start()
+
+        try:
+            attachments = post_service.attachments.local_paths(payload['attachment_ids'])
+
+            results = post_service.iter_publish_results(
+                uid=job['uid'],
+                text=payload['text'],
+                vk_groups=[g for g in payload['vk_groups'] if ('vk', g) in pending],
+                tg_channels=[c for c in payload['tg_channels'] if ('telegram', c) in pending],
+                attachments=attachments or None,
+            )
+            for result in results:
+                self._save_target(job_id, result)
+                if not result.success and result.retry_after:
+                    deferred.append(result)
+
+            # цели, упершиеся в лимит площадки, переносятся в запланированный пост
+            # (если задание не перехватил другой процесс, который перенесет их сам)
+            if deferred and not lost.is_set():
+                deferred_post_id = post_service.defer_targets(
+                    uid=job['uid'],
+                    text=payload['text'],
+                    deferred=deferred,
+                    attachment_ids=payload['attachment_ids']
+                )
+
+        except Exception as e:
+            print(f"Ошибка выполнения задания публикации {job_id}: {e}")
+            status = 'failed'
+
+        finally:
+            stop.set()
+            heartbeat.join()
+
+        self._finish(job_id, job['uid'], payload, status, deferred_post_id)
+
+    # итог задания, статистика, история и освобождение вложений;
+    # отложенные цели не считаются ошибкой, если перенесены в запланированный пост
+    def _finish(self, job_id: str, uid: str, payload: dict, status: str, deferred_post_id: str = None):
+        targets = self.store.connection().execute(
+            'SELECT status FROM job_targets WHERE job_id = ?', (job_id,)
+        ).fetchall()
+        done_statuses = ('success', 'deferred') if deferred_post_id else ('success',)
+        success = status == 'done' and all(row['status'] in done_statuses for row in targets)
+        summary = {
+            'success': success,
+            'published': sum(row['status'] == 'success' for row in targets),
+            'failed': sum(row['status'] in ('failed', 'pending') for row in targets),
+            'deferred': sum(row['status'] == 'deferred' for row in targets),
+            'deferred_post_id': deferred_post_id,
+        }
+
+        with self.store.transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, summary = ?, updated_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, json.dumps(summary), time.time(), job_id, self.owner)
+            )
+
+        # аренду перехватил другой процесс: итог, статистику и вложения оформит он
+        if cursor.rowcount == 0:
+            print(f"Аренда задания публикации {job_id} потеряна, итог не записан")
+            return
+
+        post_service = PostService()
+        StatsService().record(uid, 'published' if success else 'failed')
+
+        if success:
+            post_service.save_recent_post(uid, {
+                'text': payload['text'],
+                'vk_groups': payload['vk_groups'],
+                'tg_channels': payload['tg_channels']
+            })
+
+        post_service.attachments.release_many(payload['attachment_ids'])
+
+    # состояние задания пользователя с прогрессом по целям
+    def get(self, uid: str, job_id: str) -> dict | None:
+        conn = self.store.connection()
+        job = conn.execute(
+            'SELECT id, status, summary, created_at, updated_at FROM jobs WHERE id = ? AND uid = ?', (job_id, uid)
+        ).fetchone()
+        if job is None:
+            return None
+
+        targets = [
+            {
+                'platform': row['platform'],
+                'target_id': row['target_id'],
+                'status': row['status'],
+                'post_id': row['post_id'],
+                'error': row['error'],
+            }
+            for row in conn.execute(
+                'SELECT platform, target_id, status, post_id, error FROM job_targets WHERE job_id = ? '
+                'ORDER BY platform, target_id',
+                (job_id,)
+            )
+        ]
+
+        return {
+            'id': job['id'],
+            'status': job['status'],
+            'summary': json.loads(job['summary']) if job['summary'] else None,
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at'],
+            'progress': {
+                'total': len(targets),
+                'done': sum(target['status'] != 'pending' for target in targets),
+            },
+            'targets': targets,
+        }
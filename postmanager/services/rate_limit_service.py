@@ -0,0 +1,141 @@
+import asyncio
+import hashlib
+import time
+from decouple import config
+from .local_store_service import LocalStoreService
+
+
+# token bucket по токену vk / сессии tg; состояние в локальной sqlite,
+# поэтому лимит общий для веб-процессов и планировщика
+class RateLimitService:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            blocked_until REAL NOT NULL DEFAULT 0
+        );
+    '''
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_limits()
+        return cls._instance
+
+    def _init_limits(self):
+        self.store = LocalStoreService('rate_limits', self.SCHEMA)
+        self.limits = {
+            'vk': (
+                config('RATE_LIMIT_VK_PER_SECOND', default=3.0, cast=float),
+                config('RATE_LIMIT_VK_BURST', default=3, cast=int),
+            ),
+            'telegram': (
+                config('RATE_LIMIT_TG_PER_SECOND', default=1.0, cast=float),
+                config('RATE_LIMIT_TG_BURST', default=5, cast=int),
+            ),
+        }
+        self.max_wait = config('RATE_LIMIT_MAX_WAIT', default=10, cast=int)
+
+    # ключ бакета: секрет не хранится в открытом виде
+    @staticmethod
+    def _key(platform: str, account: str) -> str:
+        return f"{platform}:{hashlib.sha256(account.encode('utf-8')).hexdigest()}"
+
+    # одна попытка взять count токенов: 0, если взяты, иначе через сколько секунд повторить;
+    # запрос дороже burst проходит при полном бакете и уводит его в долг,
+    # следующие запросы ждут, пока долг не восполнится
+    def _take(self, key: str, rate: float, burst: int, count: int) -> float:
+        now = time.time()
+
+        with self.store.transaction() as conn:
+            row = conn.execute(
+                'SELECT tokens, updated_at, blocked_until FROM buckets WHERE key = ?', (key,)
+            ).fetchone()
+
+            if row is None:
+                tokens, blocked_until = float(burst), 0.0
+            else:
+                tokens = min(float(burst), row['tokens'] + (now - row['updated_at']) * rate)
+                blocked_until = row['blocked_until']
+
+            needed = min(count, burst)
+
+            if blocked_until > now:
+                wait = blocked_until - now
+            elif tokens >= needed:
+                tokens -= count
+                wait = 0.0
+            else:
+                wait = (needed - tokens) / rate
+
+            conn.execute(
+                'INSERT INTO buckets (key, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now, blocked_until)
+            )
+
+        return wait
+
+    # получение разрешения на count запросов; ждет не дольше max_wait,
+    # возвращает 0, если разрешение получено, иначе через сколько секунд повторить
+    def acquire(self, platform: str, account: str, count: int = 1, max_wait: float = None) -> float:
+        rate, burst = self.limits.get(platform, self.limits['vk'])
+        max_wait = self.max_wait if max_wait is None else max_wait
+        key = self._key(platform, account)
+        deadline = time.time() + max_wait
+
+        while True:
+            try:
+                wait = self._take(key, rate, burst, count)
+            except Exception as e:
+                # недоступное хранилище не должно останавливать публикацию
+                print(f"Ошибка ограничителя запросов: {e}")
+                return 0.0
+
+            if wait == 0:
+                return 0.0
+
+            if time.time() + wait > deadline:
+                return wait
+
+            time.sleep(wait)
+
+    # то же для async кода: запрос к sqlite идет в потоке, ожидание через asyncio.sleep,
+    # поэтому event loop не блокируется
+    async def aacquire(self, platform: str, account: str, count: int = 1, max_wait: float = None) -> float:
+        rate, burst = self.limits.get(platform, self.limits['vk'])
+        max_wait = self.max_wait if max_wait is None else max_wait
+        key = self._key(platform, account)
+        deadline = time.time() + max_wait
+
+        while True:
+            try:
+                wait = await asyncio.to_thread(self._take, key, rate, burst, count)
+            except Exception as e:
+                print(f"Ошибка ограничителя запросов: {e}")
+                return 0.0
+
+            if wait == 0:
+                return 0.0
+
+            if time.time() + wait > deadline:
+                return wait
+
+            await asyncio.sleep(wait)
+
+    # блокировка аккаунта на время, указанное сервером (FloodWait и т.п.)
+    def block(self, platform: str, account: str, seconds: float):
+        now = time.time()
+
+        try:
+            with self.store.transaction() as conn:
+                conn.execute(
+                    'INSERT INTO buckets (key, tokens, updated_at, blocked_until) VALUES (?, 0, ?, ?) '
+                    'ON CONFLICT(key) DO UPDATE SET blocked_until = MAX(blocked_until, excluded.blocked_until)',
+                    (self._key(platform, account), now, now + seconds)
+                )
+        except Exception as e:
+            print(f"Ошибка ограничителя запросов: {e}")
@@ -0,0 +1,129 @@
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from decouple import config
+from .post_service import PostService
+
+
+# таймер запланированных постов: посты ближайшего окна держатся в min-куче,
+# состав кучи поддерживается слушателем on_snapshot, каждый пост срабатывает в свое время
+class ScheduledTimerService:
+    def __init__(self, on_due: Callable[[dict], None]):
+        self.post_service = PostService()
+        self.on_due = on_due
+        self.window = config('SCHEDULER_WINDOW', default=3600, cast=int)
+        self.refire_after = config('SCHEDULER_REFIRE_AFTER', default=300, cast=int)
+
+        self._heap = []
+        self._posts = {}
+        # сработавшие посты: post_id -> (время повтора, данные поста)
+        self._fired = {}
+        self._condition = threading.Condition()
+        self._watch = None
+        self._horizon = None
+
+    # подписка на ожидающие посты до границы окна
+    def _subscribe(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+
+        with self._condition:
+            self._horizon = datetime.now(timezone.utc) + timedelta(seconds=self.window)
+            # после переподписки слушатель заново присылает все документы окна
+            self._posts.clear()
+            self._heap.clear()
+
+        query = self.post_service.pending_posts_query(self._horizon)
+        self._watch = query.on_snapshot(self._on_snapshot)
+
+    # изменения от firestore (вызывается в потоке слушателя)
+    def _on_snapshot(self, docs, changes, read_time):
+        with self._condition:
+            for change in changes:
+                post_id = change.document.id
+
+                if change.type.name == 'REMOVED':
+                    self._posts.pop(post_id, None)
+                    self._fired.pop(post_id, None)
+                    continue
+
+                post_data = {'id': post_id, **change.document.to_dict()}
+
+                # сработавший пост ждет REMOVED после захвата, изменения сохраняются для повтора
+                if post_id in self._fired:
+                    self._fired[post_id] = (self._fired[post_id][0], post_data)
+                    continue
+
+                scheduled_at = post_data.get('scheduled_at')
+                if not scheduled_at:
+                    continue
+
+                self._posts[post_id] = post_data
+                heapq.heappush(self._heap, (scheduled_at.timestamp(), post_id))
+
+            self._condition.notify()
+
+    # ближайший пост из кучи; устаревшие записи (удаленные или перенесенные) пропускаются
+    def _next_post(self):
+        while self._heap:
+            timestamp, post_id = self._heap[0]
+            post_data = self._posts.get(post_id)
+
+            if post_data is None or post_data['scheduled_at'].timestamp() != timestamp:
+                heapq.heappop(self._heap)
+                continue
+
+            return timestamp, post_id
+
+        return None
+
+    # пост, который так и не захватили (слушатель не прислал REMOVED), возвращается в кучу
+    # (вызывается под блокировкой)
+    def _refire_unclaimed(self, now: float):
+        for post_id, (refire_at, post_data) in list(self._fired.items()):
+            if refire_at > now:
+                continue
+
+            del self._fired[post_id]
+            scheduled_at = post_data.get('scheduled_at')
+            if scheduled_at:
+                self._posts[post_id] = post_data
+                heapq.heappush(self._heap, (scheduled_at.timestamp(), post_id))
+
+    # основной цикл: ожидание ближайшего поста без опроса firestore
+    def run_forever(self):
+        self._subscribe()
+
+        while True:
+            # окно сдвигается на половине своего срока
+            refresh_at = self._horizon.timestamp() - self.window / 2
+            due = []
+
+            with self._condition:
+                now = time.time()
+                self._refire_unclaimed(now)
+                next_post = self._next_post()
+
+                while next_post is not None and next_post[0] <= now:
+                    _, post_id = heapq.heappop(self._heap)
+                    post_data = self._posts.pop(post_id)
+                    due.append(post_data)
+                    self._fired[post_id] = (now + self.refire_after, post_data)
+                    next_post = self._next_post()
+
+                if not due:
+                    wake_at = refresh_at if next_post is None else min(next_post[0], refresh_at)
+                    if self._fired:
+                        wake_at = min(wake_at, min(refire_at for refire_at, _ in self._fired.values()))
+                    self._condition.wait(timeout=max(0.0, wake_at - now))
+
+            for post_data in due:
+                try:
+                    self.on_due(post_data)
+                except Exception as e:
+                    print(f"Ошибка обработки поста {post_data.get('id')}: {e}")
+
+            if time.time() >= refresh_at:
+                self._subscribe()
@@ -0,0 +1,72 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from decouple import config
+
+
+# параллельная публикация запланированных постов с общим лимитом и лимитом на пользователя
+class ScheduledWorkerService:
+    def __init__(self, handler: Callable):
+        self.handler = handler
+        self.user_concurrency = config('SCHEDULER_USER_CONCURRENCY', default=2, cast=int)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=config('SCHEDULER_WORKERS', default=16, cast=int),
+            thread_name_prefix='scheduled',
+        )
+        self._condition = threading.Condition()
+        self._running = {}
+        self._queued = {}
+        self._active = set()
+
+    # постановка поста в работу; повторная постановка того же поста игнорируется
+    def submit(self, post_data: dict, *args) -> bool:
+        post_id = post_data.get('id')
+        uid = post_data.get('uid')
+
+        with self._condition:
+            if post_id in self._active:
+                return False
+            self._active.add(post_id)
+
+            # сверх лимита пользователя пост ждет в очереди, не занимая поток пула
+            if self._running.get(uid, 0) < self.user_concurrency:
+                self._start(uid, post_data, args)
+            else:
+                self._queued.setdefault(uid, deque()).append((post_data, args))
+
+        return True
+
+    # запуск в пуле (вызывается под блокировкой)
+    def _start(self, uid: str, post_data: dict, args: tuple):
+        self._running[uid] = self._running.get(uid, 0) + 1
+        self._executor.submit(self._run, uid, post_data, args)
+
+    def _run(self, uid: str, post_data: dict, args: tuple):
+        try:
+            self.handler(post_data, *args)
+        except Exception as e:
+            print(f"Ошибка обработки поста {post_data.get('id')}: {e}")
+        finally:
+            with self._condition:
+                self._active.discard(post_data.get('id'))
+                self._running[uid] -= 1
+
+                # следующий пост этого же пользователя
+                queue = self._queued.get(uid)
+                if queue:
+                    next_post, next_args = queue.popleft()
+                    if not queue:
+                        del self._queued[uid]
+                    self._start(uid, next_post, next_args)
+                elif not self._running[uid]:
+                    del self._running[uid]
+
+                self._condition.notify_all()
+
+    # ожидание завершения всех поставленных постов
+    def wait(self):
+        with self._condition:
+            while self._active:
+                self._condition.wait()
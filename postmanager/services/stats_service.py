@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+from google.cloud.firestore_v1 import DELETE_FIELD, Increment
+from .firebase_service import FirebaseService
+from .profile_service import ProfileService
+
+
+# счетчики постов в документе пользователя: меняются Increment при каждом событии,
+# поэтому главная страница читает их вместе с профилем без сканирования постов
+class StatsService:
+    COLLECTION = 'users'
+
+    # изменения счетчиков по событиям; дневной счетчик публикаций - отдельно
+    EVENTS = {
+        'published': {'total_posts': 1, 'published': 1},
+        'failed': {'total_posts': 1, 'failed': 1},
+        'scheduled': {'total_posts': 1, 'scheduled': 1},
+        'cancelled': {'total_posts': -1, 'scheduled': -1},
+        'scheduled_published': {'scheduled': -1, 'published': 1},
+        'scheduled_failed': {'scheduled': -1, 'failed': 1},
+        # цели, перенесенные из-за лимитов площадки, ждут в новом посте;
+        # исходный пост уже учтен, поэтому завершение переноса меняет только scheduled
+        'deferred': {'scheduled': 1},
+        'deferred_published': {'scheduled': -1},
+        'deferred_failed': {'scheduled': -1},
+        'deferred_cancelled': {'scheduled': -1},
+    }
+
+    def __init__(self):
+        self.firebase = FirebaseService()
+        self.profiles = ProfileService()
+
+    # ключ дневного счетчика: новый день начинается с нового ключа без сброса
+    @staticmethod
+    def day_key(day: date = None) -> str:
+        return (day or date.today()).isoformat()
+
+    # изменения документа пользователя для события
+    def _changes(self, event: str) -> dict:
+        stats = {field: Increment(delta) for field, delta in self.EVENTS[event].items()}
+
+        if event in ('published', 'scheduled_published'):
+            stats['daily'] = {self.day_key(): {'published': Increment(1)}}
+
+        return {'stats': stats}
+
+    # учет события поста; ошибка учета не влияет на публикацию
+    def record(self, uid: str, event: str) -> bool:
+        try:
+            self.firebase.db.collection(self.COLLECTION).document(uid).set(self._changes(event), merge=True)
+            self.profiles.invalidate(uid)
+            return True
+        except Exception as e:
+            print(f"Ошибка обновления статистики: {e}")
+            return False
+
+    async def arecord(self, uid: str, event: str) -> bool:
+        try:
+            doc_ref = self.firebase.async_db.collection(self.COLLECTION).document(uid)
+            await doc_ref.set(self._changes(event), merge=True)
+            self.profiles.invalidate(uid)
+            return True
+        except Exception as e:
+            print(f"Ошибка обновления статистики: {e}")
+            return False
+
+    # сверка счетчика запланированных постов через count-агрегацию
+    # и удаление дневных счетчиков старше keep_days
+    def reconcile(self, uid: str, keep_days: int = 30) -> dict:
+        db = self.firebase.db
+
+        result = db.collection('scheduled_posts') \
+            .where('uid', '==', uid) \
+            .where('status', 'in', ['pending', 'claimed']) \
+            .count(alias='scheduled') \
+            .get()
+        scheduled = result[0][0].value
+
+        doc_ref = db.collection(self.COLLECTION).document(uid)
+        doc = doc_ref.get()
+        daily = ((doc.to_dict() or {}).get('stats') or {}).get('daily', {}) if doc.exists else {}
+
+        oldest = self.day_key(date.today() - timedelta(days=keep_days))
+        stale = [day for day in daily if day < oldest]
+
+        update = {'stats.scheduled': scheduled}
+        update.update({f'stats.daily.`{day}`': DELETE_FIELD for day in stale})
+        doc_ref.update(update)
+
+        self.profiles.invalidate(uid)
+        return {'scheduled': scheduled, 'pruned_days': len(stale)}
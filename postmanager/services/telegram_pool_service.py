@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable
+from decouple import config
+
+
+# подключенный клиент в пуле
+@dataclass
+class PooledClient:
+    client: Any
+    last_used: float = field(default_factory=time.monotonic)
+    in_use: int = 0
+
+
+# общий event loop в фоновом потоке и пул подключенных клиентов tg
+class TelegramPoolService:
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            # после fork фоновый поток родителя в дочернем процессе не работает
+            if cls._instance is None or cls._instance._pid != os.getpid():
+                cls._instance = super().__new__(cls)
+                cls._instance._init_pool()
+        return cls._instance
+
+    # запуск фонового потока с event loop
+    def _init_pool(self):
+        self._pid = os.getpid()
+        self.max_size = config('TG_POOL_MAX_SIZE', default=50, cast=int)
+        self.idle_ttl = config('TG_POOL_IDLE_TTL', default=300, cast=int)
+        self.call_timeout = config('TG_POOL_CALL_TIMEOUT', default=300, cast=int)
+
+        self._clients = OrderedDict()
+        self._key_locks = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name='tg-pool', daemon=True)
+        self._thread.start()
+
+        self.submit(self._evict_idle_forever())
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    # запуск корутины в общем loop, возвращает concurrent.futures.Future
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    # синхронный вызов корутины из кода django; по таймауту корутина отменяется,
+    # чтобы не выполнить действие после того, как вызывающий счел его неудачным
+    def run(self, coro):
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError('нельзя блокировать поток пула tg')
+
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=self.call_timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    # вызов корутины из другого event loop (async views) без блокировки потока
+    async def arun(self, coro):
+        future = self.submit(coro)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.call_timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    # ключ пула: сессия не хранится в открытом виде
+    @staticmethod
+    def _key(session_string: str) -> str:
+        return hashlib.sha256(session_string.encode('utf-8')).hexdigest()
+
+    # получение подключенного клиента для сессии (только внутри loop пула)
+    @asynccontextmanager
+    async def client(self, session_string: str, factory: Callable):
+        key = self._key(session_string)
+        lock = self._key_locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            pooled = self._clients.get(key)
+
+            if pooled is None:
+                pooled = PooledClient(client=factory(session_string))
+                self._clients[key] = pooled
+
+            # клиент занят до выхода из контекста и не вытесняется
+            self._clients.move_to_end(key)
+            pooled.in_use += 1
+
+            try:
+                if not pooled.client.is_connected():
+                    await pooled.client.connect()
+            except Exception:
+                pooled.in_use -= 1
+                raise
+
+        try:
+            yield pooled.client
+        finally:
+            pooled.in_use -= 1
+            pooled.last_used = time.monotonic()
+            await self._evict_overflow()
+
+    # удаление клиента из пула с отключением
+    async def _drop(self, key: str):
+        pooled = self._clients.pop(key, None)
+
+        lock = self._key_locks.get(key)
+        if lock is not None and not lock.locked():
+            del self._key_locks[key]
+
+        if pooled is not None:
+            try:
+                await pooled.client.disconnect()
+            except Exception as e:
+                print(f"Ошибка отключения клиента Telegram: {e}")
+
+    # вытеснение давно неиспользуемых клиентов сверх лимита (lru)
+    async def _evict_overflow(self):
+        overflow = len(self._clients) - self.max_size
+
+        for key in list(self._clients.keys()):
+            if overflow <= 0:
+                break
+            pooled = self._clients.get(key)
+            if pooled is not None and pooled.in_use == 0:
+                await self._drop(key)
+                overflow -= 1
+
+    # периодическое отключение простаивающих клиентов (ttl)
+    async def _evict_idle_forever(self):
+        while True:
+            await asyncio.sleep(min(60, self.idle_ttl))
+
+            deadline = time.monotonic() - self.idle_ttl
+            for key, pooled in list(self._clients.items()):
+                if self._clients.get(key) is not pooled:
+                    continue
+                if pooled.in_use == 0 and pooled.last_used < deadline:
+                    await self._drop(key)
+
+    # принудительное удаление сессии из пула (например, после отключения аккаунта)
+    def discard(self, session_string: str):
+        self.submit(self._drop(self._key(session_string)))
@@ -1,11 +1,16 @@
 import asyncio
+from concurrent.futures import Future
 from dataclasses import dataclass
 from decouple import config
 from telethon import TelegramClient
+from telethon.errors import FloodWaitError
 from telethon.sessions import StringSession
+from telethon.tl.functions.channels import GetAdminedPublicChannelsRequest
 from telethon.tl.types import Channel, Chat
 from .firebase_service import FirebaseService
 from .crypto_service import CryptoService
+from .telegram_pool_service import TelegramPoolService
+from .profile_service import ProfileService
 
 
 @dataclass
@@ -22,6 +27,8 @@ class TelegramService:
     def __init__(self):
         self.firebase = FirebaseService()
         self.crypto = CryptoService()
+        self.pool = TelegramPoolService()
+        self.profiles = ProfileService()
         self.api_id = int(config('TELEGRAM_API_ID'))
         self.api_hash = config('TELEGRAM_API_HASH')
 
@@ -70,12 +77,10 @@ class TelegramService:
             await client.disconnect()
 
     def send_code(self, phone: str) -> dict:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(self._send_code_async(phone))
-        finally:
-            loop.close()
+        return self.pool.run(self._send_code_async(phone))
+
+    async def asend_code(self, phone: str) -> dict:
+        return await self.pool.arun(self._send_code_async(phone))
 
     # авторизация с кодом подтверждения
     async def _sign_in_async(
@@ -129,117 +134,134 @@ class TelegramService:
             session_string: str,
             password: str = None
     ) -> TGAuthResult:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(
-                self._sign_in_async(phone, code, phone_code_hash, session_string, password)
-            )
-        finally:
-            loop.close()
+        return self.pool.run(
+            self._sign_in_async(phone, code, phone_code_hash, session_string, password)
+        )
+
+    async def asign_in(
+            self,
+            phone: str,
+            code: str,
+            phone_code_hash: str,
+            session_string: str,
+            password: str = None
+    ) -> TGAuthResult:
+        return await self.pool.arun(
+            self._sign_in_async(phone, code, phone_code_hash, session_string, password)
+        )
 
     # получение информации о текущем пользователе
     async def _get_me_async(self, session_string: str) -> dict | None:
-        client = self._create_client(session_string)
-
         try:
-            await client.connect()
-
-            if not await client.is_user_authorized():
-                return None
+            async with self.pool.client(session_string, self._create_client) as client:
+                if not await client.is_user_authorized():
+                    return None
 
-            me = await client.get_me()
+                me = await client.get_me()
 
-            return {
-                'user_id': me.id,
-                'first_name': me.first_name or '',
-                'last_name': me.last_name or '',
-                'username': me.username or '',
-                'phone': me.phone or '',
-            }
+                return {
+                    'user_id': me.id,
+                    'first_name': me.first_name or '',
+                    'last_name': me.last_name or '',
+                    'username': me.username or '',
+                    'phone': me.phone or '',
+                }
 
         except Exception:
             return None
 
-        finally:
-            await client.disconnect()
-
     def get_me(self, session_string: str) -> dict | None:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(self._get_me_async(session_string))
-        finally:
-            loop.close()
-
-    # получение каналов и групп где пользователь является администратором
-    async def _get_admin_channels_async(self, session_string: str) -> list:
-        client = self._create_client(session_string)
+        return self.pool.run(self._get_me_async(session_string))
+
+    async def aget_me(self, session_string: str) -> dict | None:
+        return await self.pool.arun(self._get_me_async(session_string))
+
+    # права администратора в канале/группе
+    @staticmethod
+    def _is_admin(entity) -> bool:
+        # у каналов, супергрупп и обычных групп проверяем creator или admin_rights
+        return bool(getattr(entity, 'creator', False) or getattr(entity, 'admin_rights', None))
+
+    # канал в формате, который принимает telethon при отправке
+    @staticmethod
+    def _channel_info(entity, name: str = None) -> dict:
+        if isinstance(entity, Channel):
+            channel_id = f'-100{entity.id}'
+        else:
+            channel_id = f'-{entity.id}'
+
+        return {
+            'id': channel_id,
+            'name': name or entity.title,
+            'username': getattr(entity, 'username', '') or '',
+            'is_channel': isinstance(entity, Channel) and getattr(entity, 'broadcast', False),
+        }
+
+    # поиск каналов и групп, где пользователь администратор:
+    # публичные отдает сервер одним запросом, остальные ищутся в диалогах;
+    # since - дата самого нового диалога прошлого поиска, диалоги без новых
+    # сообщений после нее не просматриваются; возвращает (каналы, дата нового диалога)
+    async def _discover_channels_async(self, session_string: str, since: float = None) -> tuple[list, float | None]:
+        async with self.pool.client(session_string, self._create_client) as client:
+            if not await client.is_user_authorized():
+                return [], since
 
-        try:
-            await client.connect()
+            channels = {}
 
-            if not await client.is_user_authorized():
-                return []
+            admined = await client(GetAdminedPublicChannelsRequest())
+            for entity in admined.chats:
+                if isinstance(entity, (Channel, Chat)):
+                    info = self._channel_info(entity)
+                    channels[info['id']] = info
 
-            channels = []
+            newest = since
 
-            # iter_dialogs возвращает все диалоги пользователя
+            # диалоги идут от новых к старым (закрепленные - первыми)
             async for dialog in client.iter_dialogs():
+                dialog_date = dialog.date.timestamp() if dialog.date else None
+
+                if not dialog.pinned and since and dialog_date and dialog_date <= since:
+                    break
+
+                if dialog_date and (newest is None or dialog_date > newest):
+                    newest = dialog_date
+
                 entity = dialog.entity
 
                 # интересуют только каналы и группы (не личные чаты)
-                if not isinstance(entity, (Channel, Chat)):
+                if not isinstance(entity, (Channel, Chat)) or not self._is_admin(entity):
                     continue
 
-                # проверяем права администратора
-                is_admin = False
-
-                if isinstance(entity, Channel):
-                    # у каналов и супергрупп проверяем creator или admin_rights
-                    if getattr(entity, 'creator', False):
-                        is_admin = True
-                    elif getattr(entity, 'admin_rights', None):
-                        is_admin = True
-                elif isinstance(entity, Chat):
-                    # для обычных групп проверяем creator или admin_rights
-                    if getattr(entity, 'creator', False):
-                        is_admin = True
-                    elif getattr(entity, 'admin_rights', None):
-                        is_admin = True
-
-                if not is_admin:
-                    continue
-
-                # формируем id в формате который принимает telethon при отправке
-                if isinstance(entity, Channel):
-                    channel_id = f'-100{entity.id}'
-                else:
-                    channel_id = f'-{entity.id}'
+                info = self._channel_info(entity, dialog.name)
+                channels[info['id']] = info
 
-                channels.append({
-                    'id': channel_id,
-                    'name': dialog.name or entity.title,
-                    'username': getattr(entity, 'username', '') or '',
-                    'is_channel': isinstance(entity, Channel) and getattr(entity, 'broadcast', False),
-                })
+            return list(channels.values()), newest
 
+    async def _get_admin_channels_async(self, session_string: str) -> list:
+        try:
+            channels, _ = await self._discover_channels_async(session_string)
             return channels
 
         except Exception as e:
             print(f"Ошибка получения каналов Telegram: {e}")
             return []
 
-        finally:
-            await client.disconnect()
-
     def get_admin_channels(self, session_string: str) -> list:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            return loop.run_until_complete(self._get_admin_channels_async(session_string))
-        finally:
-            loop.close()
+        return self.pool.run(self._get_admin_channels_async(session_string))
+
+    async def aget_admin_channels(self, session_string: str) -> list:
+        return await self.pool.arun(self._get_admin_channels_async(session_string))
+
+    # однократная загрузка вложений на сервера tg
+    async def _upload_attachments_async(self, session_string: str, attachments: list) -> list:
+        async with self.pool.client(session_string, self._create_client) as client:
+            uploads = [client.upload_file(path) for path in attachments]
+            return list(await asyncio.gather(*uploads))
+
+    # возвращает future со списком загруженных файлов (InputFile), которые
+    # можно отправлять в любое количество каналов этого аккаунта без повторной загрузки
+    def upload_attachments(self, session_string: str, attachments: list) -> Future:
+        return self.pool.submit(self._upload_attachments_async(session_string, attachments))
 
     # публикация поста в канал/группу с поддержкой медиагрупп
     async def _publish_async(
@@ -247,103 +269,139 @@ class TelegramService:
             session_string: str,
             channel_id: str,
             text: str,
-            attachments: list = None
+            attachments: list = None,
+            uploaded: Future = None
     ) -> dict:
-        client = self._create_client(session_string)
-
         try:
-            await client.connect()
-
-            if not await client.is_user_authorized():
-                return {'success': False, 'error': 'не авторизован'}
-
-            # определяем entity
-            if channel_id.startswith('@'):
-                entity = channel_id
-            else:
-                try:
-                    entity = int(channel_id)
-                except ValueError:
+            async with self.pool.client(session_string, self._create_client) as client:
+                if not await client.is_user_authorized():
+                    return {'success': False, 'error': 'не авторизован'}
+
+                # вложения, загруженные один раз на всю публикацию
+                if attachments and uploaded is not None:
+                    try:
+                        attachments = await asyncio.wrap_future(uploaded)
+                    except Exception as e:
+                        print(f"Ошибка предварительной загрузки вложений Telegram: {e}")
+
+                # определяем entity
+                if channel_id.startswith('@'):
                     entity = channel_id
-
-            if attachments and len(attachments) > 0:
-                if len(attachments) == 1:
-                    # одно вложение — обычная отправка с подписью
-                    message = await client.send_file(
-                        entity,
-                        attachments[0],
-                        caption=text or None,
-                        parse_mode='html'
-                    )
-                    message_id = str(message.id)
                 else:
-                    # несколько вложений — медиагруппа (альбом)
-                    # первый файл получает подпись, остальные без
-                    messages = await client.send_file(
-                        entity,
-                        attachments,
-                        caption=text or None,
-                        parse_mode='html'
-                    )
-                    # send_file с несколькими файлами возвращает список
-                    if isinstance(messages, list):
-                        message_id = str(messages[0].id)
+                    try:
+                        entity = int(channel_id)
+                    except ValueError:
+                        entity = channel_id
+
+                if attachments and len(attachments) > 0:
+                    if len(attachments) == 1:
+                        # одно вложение — обычная отправка с подписью
+                        message = await client.send_file(
+                            entity,
+                            attachments[0],
+                            caption=text or None,
+                            parse_mode='html'
+                        )
+                        message_id = str(message.id)
                     else:
-                        message_id = str(messages.id)
-            else:
-                # только текст
-                message = await client.send_message(entity, text, parse_mode='html')
-                message_id = str(message.id)
+                        # несколько вложений — медиагруппа (альбом)
+                        # первый файл получает подпись, остальные без
+                        messages = await client.send_file(
+                            entity,
+                            attachments,
+                            caption=text or None,
+                            parse_mode='html'
+                        )
+                        # send_file с несколькими файлами возвращает список
+                        if isinstance(messages, list):
+                            message_id = str(messages[0].id)
+                        else:
+                            message_id = str(messages.id)
+                else:
+                    # только текст
+                    message = await client.send_message(entity, text, parse_mode='html')
+                    message_id = str(message.id)
+
+                return {'success': True, 'message_id': message_id}
 
-            return {'success': True, 'message_id': message_id}
+        except FloodWaitError as e:
+            return {'success': False, 'error': str(e), 'retry_after': e.seconds}
 
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-        finally:
-            await client.disconnect()
-
     def publish(
             self,
             session_string: str,
             channel_id: str,
             text: str,
-            attachments: list = None
+            attachments: list = None,
+            uploaded: Future = None
     ) -> dict:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
         try:
-            return loop.run_until_complete(
-                self._publish_async(session_string, channel_id, text, attachments)
+            return self.pool.run(
+                self._publish_async(session_string, channel_id, text, attachments, uploaded)
             )
-        finally:
-            loop.close()
+        except TimeoutError:
+            return {'success': False, 'error': 'превышено время ожидания telegram'}
+
+    async def apublish(
+            self,
+            session_string: str,
+            channel_id: str,
+            text: str,
+            attachments: list = None,
+            uploaded: Future = None
+    ) -> dict:
+        try:
+            return await self.pool.arun(
+                self._publish_async(session_string, channel_id, text, attachments, uploaded)
+            )
+        except TimeoutError:
+            return {'success': False, 'error': 'превышено время ожидания telegram'}
+
+    # поля документа пользователя для подключенного tg аккаунта
+    def _account_fields(self, tg_data: dict) -> dict:
+        encrypted_session = self.crypto.encrypt(tg_data['session_string'])
+
+        fields = {
+            'tg_connected': True,
+            'tg_account': {
+                'session_string': encrypted_session,
+                'user_id': tg_data['user_id'],
+                'phone': tg_data.get('phone', ''),
+                'user_info': tg_data.get('user_info', {}),
+            },
+        }
+
+        # формируем словарь каналов для tg_channels (без списка каналы находит
+        # фоновый поиск ChannelDiscoveryService)
+        if 'channels' in tg_data:
+            fields['tg_channels'] = {
+                ch['id']: {'name': ch['name'], 'username': ch.get('username', '')}
+                for ch in tg_data['channels']
+            }
+
+        return fields
 
     # сохранение tg аккаунта и списка каналов в firestore
     def save_account(self, uid: str, tg_data: dict) -> bool:
         try:
             doc_ref = self.firebase.db.collection('users').document(uid)
+            doc_ref.update(self._account_fields(tg_data))
 
-            encrypted_session = self.crypto.encrypt(tg_data['session_string'])
+            self.profiles.invalidate(uid)
+            return True
 
-            # формируем словарь каналов для tg_channels
-            channels = tg_data.get('channels', [])
-            tg_channels = {
-                ch['id']: {'name': ch['name'], 'username': ch.get('username', '')}
-                for ch in channels
-            }
+        except Exception:
+            return False
 
-            doc_ref.update({
-                'tg_connected': True,
-                'tg_account': {
-                    'session_string': encrypted_session,
-                    'user_id': tg_data['user_id'],
-                    'phone': tg_data.get('phone', ''),
-                    'user_info': tg_data.get('user_info', {}),
-                },
-                'tg_channels': tg_channels,
-            })
+    async def asave_account(self, uid: str, tg_data: dict) -> bool:
+        try:
+            doc_ref = self.firebase.async_db.collection('users').document(uid)
+            await doc_ref.update(self._account_fields(tg_data))
 
+            self.profiles.invalidate(uid)
             return True
 
         except Exception:
@@ -356,12 +414,21 @@ class TelegramService:
 
             doc_ref = self.firebase.db.collection('users').document(uid)
 
+            # сессия нужна, чтобы закрыть ее клиент в пуле
+            account = self.profiles.load(uid).tg_account
+
             doc_ref.update({
                 'tg_connected': False,
                 'tg_account': DELETE_FIELD,
                 'tg_channels': DELETE_FIELD,
+                'tg_discovery': DELETE_FIELD,
             })
 
+            self.profiles.invalidate(uid)
+
+            # авторизованный клиент отключается сразу, а не по истечении простоя
+            if account and account.get('session_string'):
+                self.pool.discard(account['session_string'])
             return True
 
         except Exception:
@@ -370,30 +437,6 @@ class TelegramService:
     # получение tg аккаунта (session_string расшифровывается)
     def get_account(self, uid: str) -> dict | None:
         try:
-            doc = self.firebase.db.collection('users').document(uid).get()
-
-            if not doc.exists:
-                return None
-
-            data = doc.to_dict()
-
-            if not data.get('tg_connected'):
-                return None
-
-            account = data.get('tg_account')
-            if not account:
-                return None
-
-            encrypted_session = account.get('session_string')
-            if encrypted_session:
-                decrypted = self.crypto.decrypt(encrypted_session)
-                if decrypted:
-                    account = dict(account)
-                    account['session_string'] = decrypted
-                else:
-                    return None
-
-            return account
-
+            return self.profiles.load(uid).tg_account
         except Exception:
             return None
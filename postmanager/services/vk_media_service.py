@@ -0,0 +1,139 @@
+import hashlib
+import os
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import LRUCache
+from decouple import config
+
+
+# загрузка вложений на стену vk группы
+class VKMediaService:
+    PHOTO_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif'}
+    UPLOAD_TIMEOUT = 120
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._init_pipeline()
+        return cls._instance
+
+    # пул загрузок и кэш сохраненных вложений
+    def _init_pipeline(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=config('VK_UPLOAD_WORKERS', default=8, cast=int),
+            thread_name_prefix='vk-upload',
+        )
+        # подготовка групп идет в отдельном пуле: ее потоки ждут загрузки из пула выше
+        self._group_executor = ThreadPoolExecutor(
+            max_workers=config('VK_UPLOAD_WORKERS', default=8, cast=int),
+            thread_name_prefix='vk-prepare',
+        )
+        self._cache = LRUCache(maxsize=config('VK_MEDIA_CACHE_SIZE', default=1024, cast=int))
+        self._lock = threading.Lock()
+
+    # sha256 содержимого файла
+    @staticmethod
+    def file_digest(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    # фото или документ
+    def _kind(self, path: str) -> str:
+        extension = os.path.splitext(path)[1].lower()
+        return 'photo' if extension in self.PHOTO_EXTENSIONS else 'doc'
+
+    # сервер загрузки для типа вложения
+    @staticmethod
+    def _upload_url(vk, group_id: str, kind: str) -> str:
+        if kind == 'photo':
+            return vk.photos.getWallUploadServer(group_id=group_id)['upload_url']
+        return vk.docs.getWallUploadServer(group_id=group_id)['upload_url']
+
+    # загрузка файла и сохранение, возвращает id вложения (photo-1_2 / doc-1_2)
+    def _upload(self, vk, group_id: str, kind: str, upload_url: str, path: str) -> str:
+        field = 'photo' if kind == 'photo' else 'file'
+
+        with open(path, 'rb') as f:
+            response = requests.post(
+                upload_url,
+                files={field: (os.path.basename(path), f)},
+                timeout=self.UPLOAD_TIMEOUT
+            )
+        uploaded = response.json()
+
+        if 'error' in uploaded:
+            raise RuntimeError(f"ошибка загрузки {os.path.basename(path)}: {uploaded['error']}")
+
+        if kind == 'photo':
+            saved = vk.photos.saveWallPhoto(
+                group_id=group_id,
+                photo=uploaded['photo'],
+                server=uploaded['server'],
+                hash=uploaded['hash']
+            )[0]
+            return f"photo{saved['owner_id']}_{saved['id']}"
+
+        saved = vk.docs.save(file=uploaded['file'], title=os.path.basename(path))
+        doc = saved.get('doc') if isinstance(saved, dict) else saved[0]
+        return f"doc{doc['owner_id']}_{doc['id']}"
+
+    # подготовка вложений для wall.post: загрузка параллельно,
+    # повторные файлы для того же токена берутся из кэша по хэшу содержимого
+    def prepare(self, vk, access_token: str, group_id: str, paths: list) -> list[str]:
+        token_key = hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+        digests = list(self._executor.map(self.file_digest, paths))
+
+        attachments = {}
+        pending = {}
+
+        with self._lock:
+            for path, digest in zip(paths, digests):
+                cached = self._cache.get((token_key, group_id, digest))
+                if cached:
+                    attachments[digest] = cached
+                elif digest not in pending:
+                    pending[digest] = path
+
+        # один сервер загрузки на каждый тип вложений
+        upload_urls = {}
+        for path in pending.values():
+            kind = self._kind(path)
+            if kind not in upload_urls:
+                upload_urls[kind] = self._upload_url(vk, group_id, kind)
+
+        futures = {
+            digest: self._executor.submit(
+                self._upload, vk, group_id, self._kind(path), upload_urls[self._kind(path)], path
+            )
+            for digest, path in pending.items()
+        }
+
+        for digest, future in futures.items():
+            attachment = future.result()
+            attachments[digest] = attachment
+            with self._lock:
+                self._cache[(token_key, group_id, digest)] = attachment
+
+        return [attachments[digest] for digest in digests]
+
+    # подготовка вложений сразу для нескольких групп: группы обрабатываются параллельно,
+    # для группы возвращается список вложений или исключение
+    def prepare_many(self, vk, access_token: str, group_ids: list, paths: list) -> dict:
+        futures = {
+            group_id: self._group_executor.submit(self.prepare, vk, access_token, group_id, paths)
+            for group_id in group_ids
+        }
+
+        prepared = {}
+        for group_id, future in futures.items():
+            try:
+                prepared[group_id] = future.result()
+            except Exception as e:
+                prepared[group_id] = e
+        return prepared
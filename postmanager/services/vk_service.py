@@ -6,6 +6,7 @@ from dataclasses import dataclass
 from decouple import config
 from .firebase_service import FirebaseService
 from .crypto_service import CryptoService
+from .profile_service import ProfileService
 
 
 @dataclass
@@ -21,6 +22,7 @@ class VKService:
     def __init__(self):
         self.firebase = FirebaseService()
         self.crypto = CryptoService()
+        self.profiles = ProfileService()
         self.app_id = config('VK_APP_ID')
         self.app_secret = config('VK_APP_SECRET')
 
@@ -136,6 +138,7 @@ class VKService:
                 }
             })
 
+            self.profiles.invalidate(uid)
             return True
 
         except Exception:
@@ -153,6 +156,7 @@ class VKService:
                 'vk_account': DELETE_FIELD,
             })
 
+            self.profiles.invalidate(uid)
             return True
 
         except Exception:
@@ -161,30 +165,6 @@ class VKService:
     # получение vk аккаунта пользователя
     def get_account(self, uid: str) -> dict | None:
         try:
-            doc = self.firebase.db.collection('users').document(uid).get()
-
-            if not doc.exists:
-                return None
-
-            data = doc.to_dict()
-
-            if not data.get('vk_connected'):
-                return None
-
-            account = data.get('vk_account')
-            if not account:
-                return None
-
-            encrypted_token = account.get('access_token')
-            if encrypted_token:
-                decrypted = self.crypto.decrypt(encrypted_token)
-                if decrypted:
-                    account = dict(account)
-                    account['access_token'] = decrypted
-                else:
-                    return None
-
-            return account
-
+            return self.profiles.load(uid).vk_account
         except Exception:
             return None
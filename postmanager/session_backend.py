@@ -0,0 +1,123 @@
+import sqlite3
+import threading
+import time
+from cachetools import LRUCache
+from decouple import config
+from django.contrib.sessions.backends.base import CreateError, SessionBase, UpdateError
+from .services.local_store_service import LocalStoreService
+
+
+# сессии на сервере: в cookie только ключ, данные в локальной sqlite;
+# перед sqlite - lru кэш процесса, запись кэша действительна, пока совпадает версия строки
+class SessionStore(SessionBase):
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_key TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expire_at REAL NOT NULL,
+            version INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_expire_at ON sessions (expire_at);
+    '''
+
+    _store = None
+    _cache = LRUCache(maxsize=config('SESSION_CACHE_SIZE', default=10000, cast=int))
+    _lock = threading.Lock()
+
+    @classmethod
+    def _local_store(cls) -> LocalStoreService:
+        if cls._store is None:
+            cls._store = LocalStoreService('sessions', cls.SCHEMA)
+        return cls._store
+
+    # данные сессии: из кэша, если версия в sqlite не изменилась, иначе с декодированием
+    def load(self):
+        conn = self._local_store().connection()
+        row = conn.execute(
+            'SELECT version, expire_at FROM sessions WHERE session_key = ?', (self.session_key,)
+        ).fetchone()
+
+        if row is None or row['expire_at'] <= time.time():
+            self._session_key = None
+            return {}
+
+        with self._lock:
+            cached = self._cache.get(self.session_key)
+        if cached is not None and cached[0] == row['version']:
+            return dict(cached[1])
+
+        row = conn.execute(
+            'SELECT data, version FROM sessions WHERE session_key = ?', (self.session_key,)
+        ).fetchone()
+        if row is None:
+            self._session_key = None
+            return {}
+
+        data = self.decode(row['data'])
+        with self._lock:
+            self._cache[self.session_key] = (row['version'], dict(data))
+        return data
+
+    def exists(self, session_key):
+        row = self._local_store().connection().execute(
+            'SELECT 1 FROM sessions WHERE session_key = ? AND expire_at > ?', (session_key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def create(self):
+        while True:
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                continue
+            self.modified = True
+            return
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+
+        data = self._get_session(no_load=must_create)
+        encoded = self.encode(data)
+        expire_at = self.get_expiry_date().timestamp()
+
+        try:
+            with self._local_store().transaction() as conn:
+                if must_create:
+                    conn.execute(
+                        'INSERT INTO sessions (session_key, data, expire_at, version) VALUES (?, ?, ?, 1)',
+                        (self.session_key, encoded, expire_at)
+                    )
+                else:
+                    cursor = conn.execute(
+                        'UPDATE sessions SET data = ?, expire_at = ?, version = version + 1 WHERE session_key = ?',
+                        (encoded, expire_at, self.session_key)
+                    )
+                    # сессию удалили в другом запросе
+                    if cursor.rowcount == 0:
+                        raise UpdateError
+
+                version = conn.execute(
+                    'SELECT version FROM sessions WHERE session_key = ?', (self.session_key,)
+                ).fetchone()['version']
+        except sqlite3.IntegrityError:
+            raise CreateError
+
+        with self._lock:
+            self._cache[self.session_key] = (version, dict(data))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+
+        self._local_store().connection().execute('DELETE FROM sessions WHERE session_key = ?', (session_key,))
+        with self._lock:
+            self._cache.pop(session_key, None)
+
+    # удаление истекших сессий (manage.py clearsessions)
+    @classmethod
+    def clear_expired(cls):
+        cls._local_store().connection().execute('DELETE FROM sessions WHERE expire_at < ?', (time.time(),))
@@ -1 +1,369 @@
-from django.test import TestCase
+import asyncio
+import heapq
+import importlib
+from unittest import mock
+from google.auth.credentials import AnonymousCredentials
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+
+# модули приложения импортируются без ошибок (веб, планировщик и команды падают при старте иначе)
+class ImportSmokeTests(SimpleTestCase):
+    MODULES = [
+        'postmanager.services',
+        'postmanager.views',
+        'postmanager.session_backend',
+        'postmanager.upload_handlers',
+        'postmanager.imaging',
+        'postmanager.management.commands.backfill_scheduled_at',
+        'postmanager.management.commands.reconcile_stats',
+        'omnipost.urls',
+        'omnipost.asgi',
+    ]
+
+    def test_modules_import(self):
+        for name in self.MODULES:
+            with self.subTest(module=name):
+                importlib.import_module(name)
+
+    def test_system_check(self):
+        call_command('check')
+
+
+# путь поля с id tg канала экранируется для update
+class FieldPathTests(SimpleTestCase):
+    def test_channel_id_is_quoted(self):
+        from google.cloud.firestore_v1.field_path import FieldPath
+
+        self.assertEqual(FieldPath('tg_channels', '-100123').to_api_repr(), 'tg_channels.`-100123`')
+
+
+# асинхронный клиент firestore один на loop, его grpc-канал закрывается вместе с loop
+class AsyncClientLifetimeTests(SimpleTestCase):
+    def test_channel_closed_with_loop(self):
+        from postmanager.services.firebase_service import FirebaseService
+
+        options = {'project': 'test', 'credentials': AnonymousCredentials()}
+        with mock.patch.object(FirebaseService, '_init_app'), \
+                mock.patch.object(FirebaseService, '_client_options', return_value=options):
+            firebase = FirebaseService()
+
+            async def use():
+                client = firebase.async_db
+                client._firestore_api
+                self.assertIs(firebase.async_db, client)
+                return client
+
+            client = asyncio.run(use())
+
+        channel = client._firestore_api_internal.transport.grpc_channel
+        self.assertTrue(channel._channel.closed())
+
+
+# сработавший, но не захваченный пост возвращается в кучу таймера
+class ScheduledTimerRefireTests(SimpleTestCase):
+    def test_unclaimed_post_fires_again(self):
+        from datetime import datetime, timezone
+        from postmanager.services import scheduled_timer_service
+
+        with mock.patch.object(scheduled_timer_service, 'PostService'):
+            timer = scheduled_timer_service.ScheduledTimerService(on_due=lambda post_data: None)
+
+        post_data = {'id': 'p1', 'scheduled_at': datetime.now(timezone.utc)}
+        timer._fired['p1'] = (100.0, post_data)
+
+        timer._refire_unclaimed(99.0)
+        self.assertIsNone(timer._next_post())
+
+        timer._refire_unclaimed(100.0)
+        self.assertNotIn('p1', timer._fired)
+        self.assertEqual(timer._next_post()[1], 'p1')
+
+    # одна итерация основного цикла: наступивший пост передается в on_due и запоминается
+    def test_due_post_fired_and_recorded(self):
+        from datetime import datetime, timedelta, timezone
+        from postmanager.services import scheduled_timer_service
+
+        class StopLoop(Exception):
+            pass
+
+        fired = []
+        with mock.patch.object(scheduled_timer_service, 'PostService'):
+            timer = scheduled_timer_service.ScheduledTimerService(on_due=fired.append)
+
+        post_data = {'id': 'p1', 'scheduled_at': datetime.now(timezone.utc) - timedelta(seconds=1)}
+
+        # первая подписка кладет пост в кучу и ставит границу окна в прошлое,
+        # повторная подписка в конце итерации останавливает цикл
+        def subscribe():
+            if timer._horizon is not None:
+                raise StopLoop
+            timer._horizon = datetime.now(timezone.utc) - timedelta(seconds=timer.window)
+            timer._posts['p1'] = post_data
+            heapq.heappush(timer._heap, (post_data['scheduled_at'].timestamp(), 'p1'))
+
+        with mock.patch.object(timer, '_subscribe', side_effect=subscribe):
+            with self.assertRaises(StopLoop):
+                timer.run_forever()
+
+        self.assertEqual(fired, [post_data])
+        self.assertIs(timer._fired['p1'][1], post_data)
+
+
+# запрос дороже burst уводит бакет в долг, следующий ждет его восполнения
+class RateLimitDebtTests(SimpleTestCase):
+    def test_large_request_leaves_debt(self):
+        import uuid
+        from postmanager.services import RateLimitService
+
+        limiter = RateLimitService()
+        rate, burst = limiter.limits['vk']
+        account = uuid.uuid4().hex
+
+        self.assertEqual(limiter.acquire('vk', account, burst * 3, max_wait=0), 0)
+
+        wait = limiter.acquire('vk', account, 1, max_wait=0)
+        self.assertGreater(wait, (burst * 2) / rate)
+
+
+# кэш обработанных изображений сверх лимита теряет самые старые файлы
+class MediaCacheEvictionTests(SimpleTestCase):
+    def test_oldest_files_evicted(self):
+        import os
+        import tempfile
+        import time
+        from postmanager.services import MediaPreprocessService
+
+        service = MediaPreprocessService()
+        with tempfile.TemporaryDirectory() as cache_dir, \
+                mock.patch.object(service, 'cache_dir', cache_dir), \
+                mock.patch.object(service, 'cache_max_bytes', 10):
+            old = time.time() - service.CACHE_MIN_AGE * 2
+            for index, name in enumerate(['a.jpg', 'b.jpg', 'c.jpg']):
+                path = os.path.join(cache_dir, name)
+                with open(path, 'wb') as f:
+                    f.write(b'x' * 5)
+                os.utime(path, (old + index, old + index))
+
+            service._evict()
+
+            self.assertEqual(sorted(os.listdir(cache_dir)), ['b.jpg', 'c.jpg'])
+
+
+# завершение перенесенного поста не добавляет публикацию второй раз
+class DeferredStatsTests(SimpleTestCase):
+    def test_deferred_completion_only_updates_scheduled(self):
+        from postmanager.services import StatsService
+
+        with mock.patch('postmanager.services.stats_service.FirebaseService'), \
+                mock.patch('postmanager.services.stats_service.ProfileService'):
+            stats = StatsService()
+
+        changes = stats._changes('deferred_published')['stats']
+        self.assertEqual(set(changes), {'scheduled'})
+
+
+# корутинные задачи рассылки соблюдают лимит аккаунта
+class FanoutAsyncLimitTests(SimpleTestCase):
+    def test_account_limit_applies_to_coroutines(self):
+        from postmanager.services.fanout_service import FanoutService, FanoutTask
+
+        fanout = FanoutService()
+        running = 0
+        peak = 0
+
+        async def work():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return True
+
+        tasks = [FanoutTask(platform='telegram', account='acc', func=work) for _ in range(fanout._account_limit * 3)]
+        results = asyncio.run(fanout.arun(tasks))
+
+        self.assertTrue(all(results))
+        self.assertEqual(peak, fanout._account_limit)
+
+
+# процесс, потерявший аренду задания, не записывает итог и не трогает статистику и вложения
+class PublishJobLeaseTests(SimpleTestCase):
+    def test_finish_skipped_after_lease_lost(self):
+        import time
+        import uuid
+        from postmanager.services import publish_job_service
+
+        jobs = publish_job_service.PublishJobService()
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with jobs.store.transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, uid, status, payload, owner, lease_expires_at, created_at, updated_at) "
+                "VALUES (?, 'u', 'running', '{}', 'other-owner', ?, ?, ?)",
+                (job_id, now + 60, now, now)
+            )
+
+        self.assertFalse(jobs._renew(job_id))
+
+        payload = {'text': '', 'vk_groups': [], 'tg_channels': [], 'attachment_ids': []}
+        with mock.patch.object(publish_job_service, 'PostService') as post_service, \
+                mock.patch.object(publish_job_service, 'StatsService') as stats_service:
+            jobs._finish(job_id, 'u', payload, 'done')
+
+        stats_service.return_value.record.assert_not_called()
+        post_service.return_value.attachments.release_many.assert_not_called()
+        self.assertEqual(jobs.get('u', job_id)['status'], 'running')
+
+
+# реплика, потерявшая аренду запланированного поста во время публикации,
+# не записывает итог и не снимает ссылки на вложения
+class ScheduledClaimLeaseTests(SimpleTestCase):
+    def test_lost_claim_skips_finish(self):
+        import time
+        import scheduler
+
+        post_service = mock.MagicMock()
+        post_service.claim_scheduled_post.return_value = {'id': 'p1', 'uid': 'u', 'attachment_ids': ['b1']}
+        post_service.renew_claim.return_value = False
+        post_service.attachments.local_paths.return_value = []
+
+        def publish_post(**kwargs):
+            time.sleep(0.1)
+            return {'success': True, 'errors': [], 'deferred': []}
+
+        post_service.publish_post.side_effect = publish_post
+
+        with mock.patch.object(scheduler, 'LEASE_SECONDS', 0.03):
+            scheduler.publish_scheduled_post(post_service, {'id': 'p1'})
+
+        post_service.renew_claim.assert_called_with('p1', scheduler.WORKER_ID, 0.03)
+        post_service.finish_claimed_post.assert_not_called()
+        post_service.attachments.release_many.assert_not_called()
+
+
+# документ блоба удаляется только после файла: пока файл удаляется, put того же содержимого ждет
+class AttachmentReleaseTests(SimpleTestCase):
+    def _service(self, docs):
+        from postmanager.services import attachment_service
+
+        class Snapshot:
+            def __init__(self, data):
+                self.exists = data is not None
+                self._data = data
+
+            def to_dict(self):
+                return dict(self._data)
+
+        class DocRef:
+            def __init__(self, blob_id):
+                self.blob_id = blob_id
+
+            def get(self, transaction=None):
+                return Snapshot(docs.get(self.blob_id))
+
+        class Transaction:
+            def update(self, doc_ref, data):
+                docs[doc_ref.blob_id].update({k: v for k, v in data.items() if k == 'deleting_at'})
+                if 'refcount' in data:
+                    docs[doc_ref.blob_id]['refcount'] -= 1
+
+            def set(self, doc_ref, data):
+                docs[doc_ref.blob_id] = dict(data)
+
+            def delete(self, doc_ref):
+                docs.pop(doc_ref.blob_id, None)
+
+        firebase = mock.MagicMock()
+        firebase.db.collection.return_value.document.side_effect = DocRef
+        firebase.db.transaction.side_effect = Transaction
+
+        patches = [
+            mock.patch.object(attachment_service, 'FirebaseService', return_value=firebase),
+            mock.patch.object(attachment_service, 'transactional', lambda func: func),
+            mock.patch.object(attachment_service, 'default_storage'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        return attachment_service.AttachmentService(), attachment_service.default_storage
+
+    def test_doc_blocks_put_until_file_deleted(self):
+        docs = {'b1': {'name': 'blobs/b1/b1.jpg', 'refcount': 1}}
+        service, storage = self._service(docs)
+        states = []
+        storage.delete.side_effect = lambda name: states.append(dict(docs.get('b1') or {}))
+
+        self.assertTrue(service.release('b1'))
+
+        storage.delete.assert_called_once_with('blobs/b1/b1.jpg')
+        self.assertIn('deleting_at', states[0])
+        self.assertNotIn('b1', docs)
+
+    def test_local_copy_under_local_store_dir(self):
+        import os
+
+        service, _ = self._service({})
+        with mock.patch.object(service, 'local_dir', '/data/store'):
+            self.assertEqual(
+                service._local_copy_path('blobs/ab/abc.jpg'), os.path.join('/data/store', 'blob_cache', 'abc.jpg')
+            )
+
+
+# корутина, не уложившаяся в таймаут пула tg, отменяется в loop пула
+class TelegramPoolTimeoutTests(SimpleTestCase):
+    def _check_cancelled(self, call):
+        import threading
+        from postmanager.services.telegram_pool_service import TelegramPoolService
+
+        pool = TelegramPoolService()
+        cancelled = threading.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with mock.patch.object(pool, 'call_timeout', 0.05):
+            with self.assertRaises(TimeoutError):
+                call(pool, slow())
+
+        self.assertTrue(cancelled.wait(1))
+
+    def test_run_cancels_on_timeout(self):
+        self._check_cancelled(lambda pool, coro: pool.run(coro))
+
+    def test_arun_cancels_on_timeout(self):
+        self._check_cancelled(lambda pool, coro: asyncio.run(pool.arun(coro)))
+
+
+# потоковая публикация снимает ссылки на вложения, даже если поток ответа не читали
+class StreamPublishTests(SimpleTestCase):
+    def test_blobs_released_without_reading_stream(self):
+        from postmanager import views
+
+        post_service = mock.MagicMock()
+        attachment_service = mock.MagicMock()
+        attachment_service.local_paths.return_value = []
+
+        async def no_results(**kwargs):
+            return
+            yield
+
+        post_service.aiter_publish_results = no_results
+        post_service.collect_results.return_value = {
+            'vk': [], 'telegram': [], 'success': True, 'errors': [], 'deferred': []
+        }
+
+        async def publish():
+            views._start_publish(post_service, attachment_service, 'u', 'text', ['1'], [], ['b1'])
+            await asyncio.gather(*views._background_publishes)
+
+        with mock.patch.object(views, 'StatsService') as stats_service:
+            stats_service.return_value.arecord = mock.AsyncMock()
+            asyncio.run(publish())
+
+        attachment_service.release_many.assert_called_once_with(['b1'])
@@ -0,0 +1,48 @@
+import hashlib
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+
+# загрузка файлов сразу во временный файл на диске блоками: sha256 и размер
+# считаются на лету, при превышении лимитов прием файлов прекращается
+class LimitedHashingUploadHandler(TemporaryFileUploadHandler):
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.request_size = 0
+        self.oversized = False
+
+    # запрос заведомо больше лимита (StopUpload здесь еще не обрабатывается парсером,
+    # поэтому отказ происходит на первом файле)
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.oversized = bool(content_length and content_length > settings.UPLOAD_MAX_REQUEST_SIZE)
+
+    def new_file(self, *args, **kwargs):
+        if self.oversized:
+            self._reject('размер загрузки превышает допустимый')
+
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        self.request_size += len(raw_data)
+
+        if self.size > settings.UPLOAD_MAX_FILE_SIZE:
+            self._reject(f'файл {self.file_name} слишком большой')
+        if self.request_size > settings.UPLOAD_MAX_REQUEST_SIZE:
+            self._reject('размер загрузки превышает допустимый')
+
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.digest.hexdigest()
+        return uploaded_file
+
+    # ошибка для view; остаток тела запроса дочитывается без сохранения
+    def _reject(self, error: str):
+        if self.request is not None:
+            self.request.upload_error = error
+        raise StopUpload(connection_reset=False)
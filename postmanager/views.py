@@ -1,11 +1,13 @@
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
-from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
+from django.http import JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 from decouple import config
+import asyncio
 import json
-import os
-from .services import AuthService, VKService, TelegramService, PostService
+from .services import (
+    AuthService, VKService, TelegramService, PostService, ProfileService, AttachmentService, StatsService,
+    PublishJobService, ChannelDiscoveryService
+)
 
 # redirect uri для vk
 VK_REDIRECT_URI = config('VK_REDIRECT_URI')
@@ -19,17 +21,17 @@ def home(request):
     # проверка подключенных аккаунтов
     vk_connected = False
     tg_connected = False
+    stats = {'total_posts': 0, 'scheduled': 0, 'published_today': 0}
 
     if user_data:
-        uid = user_data.get('uid')
-        vk_service = VKService()
-        tg_service = TelegramService()
-
-        vk_account = vk_service.get_account(uid)
-        tg_account = tg_service.get_account(uid)
-
-        vk_connected = vk_account is not None
-        tg_connected = tg_account is not None
+        # профиль из кэша: без чтений firestore, пока кэш не устарел
+        try:
+            profile = ProfileService().get(user_data.get('uid'))
+            vk_connected = profile.vk_account is not None
+            tg_connected = profile.tg_account is not None
+            stats = profile.stats
+        except Exception:
+            pass
 
     context = {
         'social_networks': [
@@ -37,11 +39,7 @@ def home(request):
             {'name': 'Telegram', 'connected': tg_connected},
         ],
         'recent_posts': [],
-        'stats': {
-            'total_posts': 0,
-            'scheduled': 0,
-            'published_today': 0,
-        },
+        'stats': stats,
         'user': user_data,
         'vk_connected': vk_connected,
         'tg_connected': tg_connected,
@@ -205,8 +203,8 @@ def vk_disconnect(request):
 
 
 # отправка кода на телефон для tg
-def tg_send_code(request):
-    user = request.session.get('user')
+async def tg_send_code(request):
+    user = await request.session.aget('user')
     if not user:
         return JsonResponse({'success': False, 'error': 'требуется авторизация'})
 
@@ -224,31 +222,31 @@ def tg_send_code(request):
         return JsonResponse({'success': False, 'error': 'укажите номер телефона'})
 
     tg_service = TelegramService()
-    result = tg_service.send_code(phone)
+    result = await tg_service.asend_code(phone)
 
     if not result['success']:
         return JsonResponse({'success': False, 'error': result.get('error', 'ошибка отправки кода')})
 
     # сохранение данных в сессию для tg
-    request.session['tg_auth'] = {
+    await request.session.aset('tg_auth', {
         'phone': phone,
         'phone_code_hash': result['phone_code_hash'],
         'session_string': result['session_string'],
-    }
+    })
 
     return JsonResponse({'success': True, 'message': 'код отправлен'})
 
 
 # подтверждение кода для tg
-def tg_verify_code(request):
-    user = request.session.get('user')
+async def tg_verify_code(request):
+    user = await request.session.aget('user')
     if not user:
         return JsonResponse({'success': False, 'error': 'требуется авторизация'})
 
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'method_not_allowed'})
 
-    tg_auth = request.session.get('tg_auth')
+    tg_auth = await request.session.aget('tg_auth')
     if not tg_auth:
         return JsonResponse({'success': False, 'error': 'сначала запросите код'})
 
@@ -265,7 +263,7 @@ def tg_verify_code(request):
         return JsonResponse({'success': False, 'error': 'укажите код'})
 
     tg_service = TelegramService()
-    result = tg_service.sign_in(
+    result = await tg_service.asign_in(
         phone=tg_auth['phone'],
         code=code,
         phone_code_hash=tg_auth['phone_code_hash'],
@@ -279,27 +277,53 @@ def tg_verify_code(request):
         return JsonResponse({'success': False, 'error': result.error})
 
     # получение информации о пользователе tg
-    user_info = tg_service.get_me(result.session_string)
-
-
-    # получение каналов
-    admin_channels = tg_service.get_admin_channels(result.session_string)
+    user_info = await tg_service.aget_me(result.session_string)
 
     # сохранение в firestore
-    tg_service.save_account(user['uid'], {
+    await tg_service.asave_account(user['uid'], {
         'session_string': result.session_string,
         'user_id': result.user_id,
         'phone': result.phone,
         'user_info': user_info or {},
-        'channels': admin_channels,
     })
 
+    # каналы ищутся в фоне, ответ не ждет просмотра диалогов
+    ChannelDiscoveryService().start(user['uid'], result.session_string, full=True)
+
     # очистка временных данных
-    del request.session['tg_auth']
+    await request.session.apop('tg_auth', None)
 
     return JsonResponse({'success': True, 'message': 'telegram подключен'})
 
 
+# повторный поиск tg каналов в фоне; full - просмотр всех диалогов
+async def tg_refresh_channels(request):
+    user = await request.session.aget('user')
+    if not user:
+        return JsonResponse({'success': False, 'error': 'требуется авторизация'})
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'method_not_allowed'})
+
+    try:
+        full = bool(json.loads(request.body).get('full'))
+    except Exception:
+        full = request.POST.get('full') == '1'
+
+    profile = await ProfileService().aload(user['uid'])
+    session_string = profile.tg_session
+    if not session_string:
+        return JsonResponse({'success': False, 'error': 'telegram не подключен'})
+
+    started = ChannelDiscoveryService().start(user['uid'], session_string, full=full)
+
+    return JsonResponse({
+        'success': True,
+        'message': 'поиск каналов запущен' if started else 'поиск каналов уже идет',
+        'status': 'running'
+    })
+
+
 # отключение tg аккаунта
 def tg_disconnect(request):
     user = request.session.get('user')
@@ -311,27 +335,39 @@ def tg_disconnect(request):
 
     return redirect('home')
 
+# разбор тела запроса с формой и файлами
+def _parse_form(request):
+    return request.POST, request.FILES
+
+
 # публикация поста
-def publish_post(request):
-    user = request.session.get('user')
+async def publish_post(request):
+    user = await request.session.aget('user')
     if not user:
         return JsonResponse({'success': False, 'error': 'требуется авторизация'})
 
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'method_not_allowed'})
 
-    # получение данных из формы
-    text = request.POST.get('text', '').strip()
-    vk_groups_str = request.POST.get('vk_groups', '')
-    tg_channels_str = request.POST.get('tg_channels', '')
-    scheduled_time = request.POST.get('scheduled_time', '')
+    # получение данных из формы: разбор multipart (чтение тела и хэширование файлов
+    # обработчиком загрузки) выполняется в потоке, не в loop
+    form, uploaded_files = await sync_to_async(_parse_form, thread_sensitive=False)(request)
+    text = form.get('text', '').strip()
+    vk_groups_str = form.get('vk_groups', '')
+    tg_channels_str = form.get('tg_channels', '')
+    scheduled_time = form.get('scheduled_time', '')
 
     # парсинг списков групп/каналов
     vk_groups = [g.strip() for g in vk_groups_str.split(',') if g.strip()]
     tg_channels = [c.strip() for c in tg_channels_str.split(',') if c.strip()]
 
+    # файлы сверх лимитов не принимаются обработчиком загрузки
+    files = uploaded_files.getlist('files')
+    upload_error = getattr(request, 'upload_error', None)
+    if upload_error:
+        return JsonResponse({'success': False, 'error': upload_error})
+
     # проверка на текст или изображения
-    files = request.FILES.getlist('files')
     if not text and not files:
         return JsonResponse({'success': False, 'error': 'добавьте текст или изображение'})
 
@@ -339,16 +375,14 @@ def publish_post(request):
     if not vk_groups and not tg_channels:
         return JsonResponse({'success': False, 'error': 'укажите хотя бы одну группу или канал'})
 
-    # сохранение загруженных файлов во временную директорию
-    saved_files = []
+    # сохранение загруженных файлов в хранилище вложений (по хэшу содержимого);
+    # синхронные операции с файлами и sqlite выполняются в потоках, не в loop
+    attachment_service = AttachmentService()
+    blob_ids = []
+    blobs_owned_by_post = False
     try:
         for uploaded_file in files:
-            filename = default_storage.save(
-                f'temp/{uploaded_file.name}',
-                ContentFile(uploaded_file.read())
-            )
-            file_path = default_storage.path(filename)
-            saved_files.append(file_path)
+            blob_ids.append(await sync_to_async(attachment_service.put, thread_sensitive=False)(uploaded_file))
 
         post_service = PostService()
 
@@ -372,18 +406,22 @@ def publish_post(request):
                 })
 
             # сохранение запланированного поста
-            post_id = post_service.save_scheduled_post(
+            post_id = await sync_to_async(post_service.save_scheduled_post, thread_sensitive=False)(
                 uid=user['uid'],
                 text=text,
                 vk_groups=vk_groups,
                 tg_channels=tg_channels,
                 scheduled_time=scheduled_time,
-                attachments=saved_files if saved_files else None
+                attachment_ids=blob_ids if blob_ids else None
             )
 
             if post_id:
+                # ссылки на вложения теперь принадлежат запланированному посту
+                blobs_owned_by_post = True
+                await StatsService().arecord(user['uid'], 'scheduled')
+
                 # Сохранение в недавние посты
-                post_service.save_recent_post(user['uid'], {
+                await sync_to_async(post_service.save_recent_post, thread_sensitive=False)(user['uid'], {
                     'text': text,
                     'vk_groups': vk_groups,
                     'tg_channels': tg_channels,
@@ -402,8 +440,46 @@ def publish_post(request):
                     'error': 'ошибка планирования поста'
                 })
 
+        # фоновая публикация: задание сохраняется и ответ возвращается сразу,
+        # прогресс по целям - через /api/publish-jobs/<job_id>/
+        if form.get('mode') == 'job':
+            job_service = await sync_to_async(PublishJobService, thread_sensitive=False)()
+            job_id = await sync_to_async(job_service.create, thread_sensitive=False)(
+                uid=user['uid'],
+                text=text,
+                vk_groups=vk_groups,
+                tg_channels=tg_channels,
+                attachment_ids=blob_ids
+            )
+
+            # ссылки на вложения освобождает задание после публикации
+            blobs_owned_by_post = True
+
+            return JsonResponse({
+                'success': True,
+                'message': 'публикация запущена',
+                'scheduled': False,
+                'job_id': job_id,
+                'status_url': f'/api/publish-jobs/{job_id}/'
+            }, status=202)
+
+        # потоковая публикация: результат каждой цели отправляется сразу (server-sent events)
+        if form.get('mode') == 'stream':
+            events = _start_publish(
+                post_service, attachment_service, user['uid'], text, vk_groups, tg_channels, blob_ids
+            )
+            # ссылки на вложения освобождает задача публикации
+            blobs_owned_by_post = True
+
+            return StreamingHttpResponse(
+                _relay_events(events),
+                content_type='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+
         # немедленная публикация
-        results = post_service.publish_post(
+        saved_files = await sync_to_async(attachment_service.local_paths, thread_sensitive=False)(blob_ids)
+        results = await post_service.apublish_post(
             uid=user['uid'],
             text=text,
             vk_groups=vk_groups,
@@ -411,54 +487,156 @@ def publish_post(request):
             attachments=saved_files if saved_files else None
         )
 
-        # формирование ответа
-        response = {
-            'success': results['success'],
-            'message': 'пост опубликован' if results['success'] else 'ошибка публикации',
-            'scheduled': False,
-            'vk_results': [
-                {
-                    'group_id': r.group_id,
-                    'success': r.success,
-                    'post_id': r.post_id,
-                    'error': r.error
-                }
-                for r in results['vk']
-            ],
-            'telegram_results': [
-                {
-                    'channel_id': r.group_id,
-                    'success': r.success,
-                    'post_id': r.post_id,
-                    'error': r.error
-                }
-                for r in results['telegram']
-            ],
-            'errors': results['errors']
-        }
-
-        # Сохранение в недавние посты если успешно
-        if results['success']:
-            post_service.save_recent_post(user['uid'], {
-                'text': text,
-                'vk_groups': vk_groups,
-                'tg_channels': tg_channels
-            })
-
-        return JsonResponse(response)
+        await _defer_targets(post_service, user['uid'], text, results, blob_ids)
+        await _finish_publish(post_service, user['uid'], text, vk_groups, tg_channels, results['success'])
+
+        return JsonResponse(_publish_response(results))
 
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
 
     finally:
-        # удаление временных файлов
-        if not scheduled_time:
-            for file_path in saved_files:
-                try:
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                except:
-                    pass
+        # ссылки запроса на вложения снимаются (файл удаляется, если он больше нигде не нужен)
+        if not blobs_owned_by_post:
+            await sync_to_async(attachment_service.release_many, thread_sensitive=False)(blob_ids)
+
+
+# цели, упершиеся в лимит площадки, переносятся в запланированный пост, как в планировщике;
+# если перенести не удалось, они остаются в ответе ошибками
+async def _defer_targets(post_service, uid, text, results, blob_ids):
+    if not results['deferred']:
+        return
+
+    deferred_post_id = await sync_to_async(post_service.defer_targets, thread_sensitive=False)(
+        uid=uid,
+        text=text,
+        deferred=results['deferred'],
+        attachment_ids=blob_ids
+    )
+
+    if deferred_post_id:
+        results['deferred_post_id'] = deferred_post_id
+        results['success'] = not results['errors']
+
+
+# ответ на немедленную публикацию
+def _publish_response(results: dict) -> dict:
+    deferred_post_id = results.get('deferred_post_id')
+
+    return {
+        'success': results['success'],
+        'message': 'пост опубликован' if results['success'] else 'ошибка публикации',
+        'scheduled': False,
+        # отложенные цели и запланированный пост, в который они перенесены
+        'deferred_post_id': deferred_post_id,
+        'deferred': [
+            {
+                'platform': r.platform,
+                'group_id': r.group_id,
+                'retry_after': r.retry_after
+            }
+            for r in results['deferred']
+        ] if deferred_post_id else [],
+        'vk_results': [
+            {
+                'group_id': r.group_id,
+                'success': r.success,
+                'post_id': r.post_id,
+                'error': r.error
+            }
+            for r in results['vk']
+        ],
+        'telegram_results': [
+            {
+                'channel_id': r.group_id,
+                'success': r.success,
+                'post_id': r.post_id,
+                'error': r.error
+            }
+            for r in results['telegram']
+        ],
+        'errors': results['errors'] + [
+            f"{'VK группа' if r.platform == 'vk' else 'Telegram канал'} {r.group_id}: {r.error}"
+            for r in results['deferred']
+            if not deferred_post_id
+        ]
+    }
+
+
+# учет завершенной публикации: статистика и недавние посты
+async def _finish_publish(post_service, uid, text, vk_groups, tg_channels, success):
+    await StatsService().arecord(uid, 'published' if success else 'failed')
+
+    # Сохранение в недавние посты если успешно
+    if success:
+        await sync_to_async(post_service.save_recent_post, thread_sensitive=False)(uid, {
+            'text': text,
+            'vk_groups': vk_groups,
+            'tg_channels': tg_channels
+        })
+
+
+# публикации, продолжающиеся после отключения клиента от потока
+_background_publishes = set()
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# запуск потоковой публикации: result по каждой цели по мере готовности, в конце summary;
+# задача запускается до ответа и сама снимает ссылки на вложения, поэтому завершается,
+# даже если клиент отключился или поток ответа так и не начали читать
+def _start_publish(post_service, attachment_service, uid, text, vk_groups, tg_channels, blob_ids) -> asyncio.Queue:
+    events = asyncio.Queue()
+
+    async def publish():
+        try:
+            saved_files = await sync_to_async(attachment_service.local_paths, thread_sensitive=False)(blob_ids)
+            post_results = []
+
+            async for result in post_service.aiter_publish_results(
+                uid=uid,
+                text=text,
+                vk_groups=vk_groups,
+                tg_channels=tg_channels,
+                attachments=saved_files if saved_files else None
+            ):
+                post_results.append(result)
+                events.put_nowait(('result', {
+                    'platform': result.platform,
+                    'group_id': result.group_id,
+                    'success': result.success,
+                    'post_id': result.post_id,
+                    'error': result.error,
+                    'retry_after': result.retry_after
+                }))
+
+            results = post_service.collect_results(post_results)
+            await _defer_targets(post_service, uid, text, results, blob_ids)
+            await _finish_publish(post_service, uid, text, vk_groups, tg_channels, results['success'])
+            events.put_nowait(('summary', _publish_response(results)))
+
+        except Exception as e:
+            events.put_nowait(('summary', {'success': False, 'error': str(e)}))
+
+        finally:
+            await sync_to_async(attachment_service.release_many, thread_sensitive=False)(blob_ids)
+
+    task = asyncio.ensure_future(publish())
+    _background_publishes.add(task)
+    task.add_done_callback(_background_publishes.discard)
+
+    return events
+
+
+# поток событий запущенной публикации (server-sent events)
+async def _relay_events(events: asyncio.Queue):
+    while True:
+        event, data = await events.get()
+        yield _sse_event(event, data)
+        if event == 'summary':
+            break
 
 
 # сохранение токена доступа vk группы
@@ -574,15 +752,21 @@ def remove_tg_channel(request):
 
 
 # получение списка сохраненных групп и каналов
-def get_saved_groups(request):
-    user = request.session.get('user')
+async def get_saved_groups(request):
+    user = await request.session.aget('user')
     if not user:
         return JsonResponse({'success': False, 'error': 'требуется авторизация'})
 
-    post_service = PostService()
-
-    vk_groups = post_service.get_vk_groups(user['uid'])
-    tg_channels = post_service.get_tg_channels(user['uid'])
+    # группы и каналы из одного чтения документа пользователя
+    try:
+        profile = await ProfileService().aload(user['uid'])
+        vk_groups = profile.vk_groups
+        tg_channels = profile.tg_channels
+        tg_discovery = (profile.data or {}).get('tg_discovery') or {}
+    except Exception:
+        vk_groups = {}
+        tg_channels = {}
+        tg_discovery = {}
 
     vk_list = [
         {'id': group_id, 'name': f"VK Group {group_id}"}
@@ -597,20 +781,61 @@ def get_saved_groups(request):
     return JsonResponse({
         'success': True,
         'vk_groups': vk_list,
-        'tg_channels': tg_list
+        'tg_channels': tg_list,
+        # состояние фонового поиска tg каналов: running / done / failed
+        'tg_discovery': tg_discovery.get('status')
     })
 
 
 # получение недавних постов
-def get_recent_posts(request):
-    user = request.session.get('user')
+async def get_recent_posts(request):
+    user = await request.session.aget('user')
     if not user:
         return JsonResponse({'success': False, 'error': 'требуется авторизация'})
 
     post_service = PostService()
-    recent_posts = post_service.get_recent_posts(user['uid'])
+    recent_posts = await sync_to_async(post_service.get_recent_posts, thread_sensitive=False)(user['uid'])
 
     return JsonResponse({
         'success': True,
         'posts': recent_posts
     })
+
+
+# история публикаций постранично: ?limit=20&cursor=<id последней записи>
+def get_post_history(request):
+    user = request.session.get('user')
+    if not user:
+        return JsonResponse({'success': False, 'error': 'требуется авторизация'})
+
+    try:
+        limit = int(request.GET.get('limit', 20))
+        cursor = request.GET.get('cursor')
+        before = int(cursor) if cursor else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'некорректные параметры'})
+
+    post_service = PostService()
+    posts, next_cursor = post_service.get_post_history(user['uid'], limit, before)
+
+    return JsonResponse({
+        'success': True,
+        'posts': posts,
+        'next_cursor': next_cursor
+    })
+
+
+# состояние фоновой публикации с прогрессом по целям
+def get_publish_job(request, job_id):
+    user = request.session.get('user')
+    if not user:
+        return JsonResponse({'success': False, 'error': 'требуется авторизация'})
+
+    job = PublishJobService().get(user['uid'], job_id)
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'задание не найдено'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'job': job
+    })
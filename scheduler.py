@@ -1,6 +1,11 @@
+import asyncio
 import os
+import socket
 import sys
+import threading
+import uuid
 import django
+from decouple import config
 from datetime import datetime, timezone
 import time
 
@@ -9,75 +14,235 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'omnipost.settings')
 django.setup()
 
-from postmanager.services import PostService
+from postmanager.services import (
+    CryptoService, PostService, ProfileService, PublishJobService, ScheduledTimerService, ScheduledWorkerService
+)
 
 
-def process_scheduled_posts():
+# количество постов на странице выборки и максимум за один проход
+PAGE_SIZE = config('SCHEDULER_PAGE_SIZE', default=100, cast=int)
+MAX_POSTS_PER_TICK = config('SCHEDULER_MAX_POSTS_PER_TICK', default=1000, cast=int)
+
+# идентификатор реплики и срок аренды захваченного поста
+WORKER_ID = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+LEASE_SECONDS = config('SCHEDULER_LEASE_SECONDS', default=900, cast=int)
+
+# один event loop на процесс: асинхронный клиент firestore и его grpc-канал
+# создаются один раз, а не на каждую страницу выборки
+LOOP = asyncio.new_event_loop()
+
+
+# пул публикации запланированных постов
+def create_workers():
+    post_service = PostService()
+    return ScheduledWorkerService(
+        lambda post_data, profile=None: publish_scheduled_post(post_service, post_data, profile)
+    )
+
+
+def process_scheduled_posts(workers=None):
     post_service = PostService()
+    workers = workers or create_workers()
     now = datetime.now(timezone.utc)
 
+    # только посты, время которых наступило, постранично по индексу scheduled_at
     try:
-        pending_posts = post_service.get_all_pending_posts()
+        for due_posts in post_service.iter_due_post_pages(now, PAGE_SIZE, MAX_POSTS_PER_TICK):
+            # профили авторов страницы читаются одновременно через асинхронный клиент
+            try:
+                profiles = LOOP.run_until_complete(ProfileService().aload_many([p.get('uid') for p in due_posts]))
+
+                # секреты всех авторов страницы расшифровываются одним пакетом,
+                # публикации берут их из кэша CryptoService
+                CryptoService().decrypt_many(
+                    secret for profile in profiles.values() for secret in profile.encrypted_secrets()
+                )
+            except Exception as e:
+                print(f"Ошибка загрузки профилей: {e}")
+                profiles = {}
+
+            # посты публикуются параллельно, статус каждого обновляется отдельно
+            for post_data in due_posts:
+                workers.submit(post_data, profiles.get(post_data.get('uid')))
+
     except Exception as e:
         print(f"Ошибка получения постов: {e}")
+
+    reclaim_expired_posts(workers)
+
+    # следующий проход начинается после обновления статусов этого
+    workers.wait()
+
+
+# публикация одного запланированного поста и обновление его статуса
+def publish_scheduled_post(post_service, post_data, profile=None):
+    post_id = post_data.get('id')
+
+    # пост публикует только реплика, захватившая его в транзакции
+    claimed = post_service.claim_scheduled_post(post_id, WORKER_ID, LEASE_SECONDS)
+    if claimed is None:
         return
+    post_data = {**post_data, **claimed}
 
-    for post_data in pending_posts:
-        post_id = post_data.get('id')
+    print(f"Публикация поста {post_id}...")
+    keep_attachments = False
+    finished = False
 
-        scheduled_time_str = post_data.get('scheduled_time')
-        if not scheduled_time_str:
-            continue
+    # аренда продлевается, пока идет публикация (FloodWait, долгие загрузки)
+    stop = threading.Event()
+    lost = threading.Event()
+    heartbeat = threading.Thread(
+        target=renew_claim_forever, args=(post_service, post_id, stop, lost),
+        name=f'claim-{post_id}', daemon=True
+    )
+    heartbeat.start()
 
-        try:
-            scheduled_time = datetime.fromisoformat(scheduled_time_str.replace('Z', '+00:00'))
-        except Exception:
-            print(f"Ошибка парсинга времени для поста {post_id}")
-            continue
+    try:
+        # вложения из хранилища по id и старые посты с локальными путями
+        attachments = (post_data.get('attachments') or []) + \
+            post_service.attachments.local_paths(post_data.get('attachment_ids'))
 
-        if scheduled_time > now:
-            continue
+        results = post_service.publish_post(
+            uid=post_data.get('uid'),
+            text=post_data.get('text', ''),
+            vk_groups=post_data.get('vk_groups', []),
+            tg_channels=post_data.get('tg_channels', []),
+            attachments=attachments or None,
+            profile=profile,
+        )
 
-        print(f"Публикация поста {post_id}...")
+        # пост перехватила другая реплика: итог, перенос и вложения остаются ей
+        if lost.is_set():
+            print(f"Аренда поста {post_id} потеряна во время публикации")
+            return
 
-        try:
-            results = post_service.publish_post(
-                uid=post_data.get('uid'),
-                text=post_data.get('text', ''),
-                vk_groups=post_data.get('vk_groups', []),
-                tg_channels=post_data.get('tg_channels', []),
-                attachments=post_data.get('attachments') or None,
-            )
-
-            if results['success']:
-                post_service.update_scheduled_post_status(post_id, 'published')
-                print(f"Пост {post_id} успешно опубликован")
+        # цели, упершиеся в лимит площадки, переносятся в отдельный пост,
+        # остальные цели повторно не публикуются
+        if results['deferred']:
+            deferred_post_id = defer_targets(post_service, post_data, results['deferred'])
+            if deferred_post_id:
+                keep_attachments = True
             else:
-                error_msg = ', '.join(results.get('errors', []))
-                post_service.update_scheduled_post_status(post_id, 'failed', error_msg)
-                print(f"Ошибка публикации поста {post_id}: {error_msg}")
+                results['errors'].extend(r.error for r in results['deferred'])
+
+        if not results['errors']:
+            finished = finish_post(post_service, post_data, 'published')
+            print(f"Пост {post_id} успешно опубликован")
+        else:
+            error_msg = ', '.join(results.get('errors', []))
+            finished = finish_post(post_service, post_data, 'failed', error_msg)
+            print(f"Ошибка публикации поста {post_id}: {error_msg}")
+
+    except Exception as e:
+        print(f"Исключение при публикации поста {post_id}: {e}")
+        finished = finish_post(post_service, post_data, 'failed', str(e))
+
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    # статус записала другая реплика: вложения поста освободит она
+    if not finished:
+        return
+
+    # ссылки поста на вложения снимаются (отложенный пост держит свои)
+    post_service.attachments.release_many(post_data.get('attachment_ids'))
 
+    # удаление временных файлов старых постов (кроме нужных отложенному посту)
+    if keep_attachments:
+        return
+
+    for file_path in (post_data.get('attachments') or []):
+        try:
+            if os.path.exists(file_path):
+                os.remove(file_path)
         except Exception as e:
-            print(f"Исключение при публикации поста {post_id}: {e}")
-            post_service.update_scheduled_post_status(post_id, 'failed', str(e))
+            print(f"Ошибка удаления файла {file_path}: {e}")
 
-        # удаление временных файлов независимо от результата
-        for file_path in (post_data.get('attachments') or []):
-            try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-            except Exception as e:
-                print(f"Ошибка удаления файла {file_path}: {e}")
+
+# перенос отложенных целей в новый запланированный пост на время, указанное площадкой
+def defer_targets(post_service, post_data, deferred):
+    deferred_post_id = post_service.defer_targets(
+        uid=post_data.get('uid'),
+        text=post_data.get('text', ''),
+        deferred=deferred,
+        attachments=post_data.get('attachments'),
+        attachment_ids=post_data.get('attachment_ids'),
+    )
+
+    if deferred_post_id:
+        print(f"Пост {post_data.get('id')}: {len(deferred)} целей перенесено в пост {deferred_post_id}")
+    return deferred_post_id
+
+
+# продление аренды поста, пока stop не выставлен; lost - аренду перехватила другая реплика
+def renew_claim_forever(post_service, post_id, stop, lost):
+    while not stop.wait(LEASE_SECONDS / 3):
+        try:
+            if not post_service.renew_claim(post_id, WORKER_ID, LEASE_SECONDS):
+                lost.set()
+                return
+        except Exception as e:
+            print(f"Ошибка продления аренды поста {post_id}: {e}")
+
+
+# итоговый статус поста; если аренду успела перехватить другая реплика, статус не меняется
+def finish_post(post_service, post_data, status, error=None) -> bool:
+    post_id = post_data.get('id')
+    if not post_service.finish_claimed_post(post_id, WORKER_ID, status, error):
+        print(f"Аренда поста {post_id} потеряна, статус {status} не записан")
+        return False
+
+    # завершение перенесенного поста не считается новой публикацией
+    prefix = 'deferred' if post_data.get('deferred') else 'scheduled'
+    post_service.stats.record(post_data.get('uid'), f'{prefix}_{status}')
+    return True
+
+
+# возврат в работу постов с истекшей арендой
+def reclaim_expired_posts(workers):
+    for post_data in PostService().get_expired_claims():
+        print(f"Повторный захват поста {post_data.get('id')} с истекшей арендой")
+        workers.submit(post_data)
+
+
+# режим по событиям: посты срабатывают в свое время без опроса
+def run_event_mode():
+    workers = create_workers()
+
+    # слушатель видит только pending: истекшие аренды проверяются отдельно
+    def reclaim_forever():
+        while True:
+            time.sleep(LEASE_SECONDS / 2)
+            reclaim_expired_posts(workers)
+            PublishJobService().recover()
+
+    threading.Thread(target=reclaim_forever, name='reclaim', daemon=True).start()
+
+    timer = ScheduledTimerService(on_due=workers.submit)
+    timer.run_forever()
 
 
 def main():
     print("Запуск планировщика постов...")
+
+    # фоновые публикации, брошенные завершившимися веб-процессами, выполняет планировщик
+    PublishJobService()
+
+    if config('SCHEDULER_MODE', default='poll') == 'event':
+        print("Режим по событиям (слушатель firestore)")
+        run_event_mode()
+        return
+
     print("Проверка каждые 60 секунд")
 
+    workers = create_workers()
+
     while True:
         try:
             print(f"\n[{datetime.now()}] Проверка запланированных постов...")
-            process_scheduled_posts()
+            process_scheduled_posts(workers)
+            PublishJobService().recover()
             print("Проверка завершена")
         except Exception as e:
             print(f"Критическая ошибка: {e}")
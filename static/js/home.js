@@ -90,6 +90,10 @@ function getCookie(name) {
     return cookieValue;
 }
 
+// опрос списка групп, пока идет фоновый поиск tg каналов
+let tgDiscoveryPolls = 0;
+const TG_DISCOVERY_MAX_POLLS = 60;
+
 // загрузка сохраненных групп
 async function loadSavedGroups() {
     try {
@@ -98,13 +102,44 @@ async function loadSavedGroups() {
 
         if (data.success) {
             renderVkGroups(data.vk_groups);
-            renderTgChannels(data.tg_channels);
+            renderTgChannels(data.tg_channels, data.tg_discovery === 'running');
+
+            if (data.tg_discovery === 'running' && tgDiscoveryPolls < TG_DISCOVERY_MAX_POLLS) {
+                tgDiscoveryPolls++;
+                setTimeout(loadSavedGroups, 3000);
+            } else {
+                tgDiscoveryPolls = 0;
+            }
         }
     } catch (error) {
         console.error('Error loading groups:', error);
     }
 }
 
+// повторный поиск tg каналов (полный просмотр диалогов)
+async function refreshTgChannels() {
+    try {
+        const response = await fetch('/api/tg-refresh-channels/', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-CSRFToken': getCookie('csrftoken')
+            },
+            body: JSON.stringify({ full: true })
+        });
+        const data = await response.json();
+
+        if (data.success) {
+            tgDiscoveryPolls = 0;
+            loadSavedGroups();
+        } else {
+            alert('Refresh error: ' + data.error);
+        }
+    } catch (error) {
+        alert('Connection error: ' + error.message);
+    }
+}
+
 // загрузка недавних постов
 async function loadRecentPosts() {
     try {
@@ -184,13 +219,15 @@ function renderVkGroups(groups) {
 }
 
 // отрисовка tg каналов
-function renderTgChannels(channels) {
+function renderTgChannels(channels, searching = false) {
     const container = document.getElementById('tgChannelsList');
 
     if (!container) return;
 
     if (channels.length === 0) {
-        container.innerHTML = '<div class="no-groups">NO CHANNELS SAVED</div>';
+        container.innerHTML = searching
+            ? '<div class="no-groups">SEARCHING CHANNELS...</div>'
+            : '<div class="no-groups">NO CHANNELS SAVED</div>';
         return;
     }
 
@@ -402,6 +439,48 @@ async function deleteTgChannel(channelId) {
     }
 }
 
+// чтение потока результатов публикации (server-sent events), возвращает итоговое событие
+async function readPublishStream(response, publishBtn, total) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let completed = 0;
+    let summary = null;
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+
+        buffer += decoder.decode(value, { stream: true });
+
+        // события разделяются пустой строкой
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const chunk = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of chunk.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (!data) continue;
+
+            const payload = JSON.parse(data);
+
+            if (event === 'result') {
+                completed++;
+                publishBtn.textContent = `PUBLISHING... ${completed}/${total}`;
+            } else if (event === 'summary') {
+                summary = payload;
+            }
+        }
+    }
+
+    return summary || { success: false, error: 'Publishing stream interrupted' };
+}
+
 // функция публикации поста
 async function publishPost() {
     const postText = document.getElementById('postText');
@@ -431,6 +510,9 @@ async function publishPost() {
 
     if (scheduledTime) {
         formData.append('scheduled_time', scheduledTime);
+    } else {
+        // результаты по каждой группе/каналу приходят по мере публикации
+        formData.append('mode', 'stream');
     }
 
     for (let i = 0; i < files.length; i++) {
@@ -449,7 +531,10 @@ async function publishPost() {
             body: formData
         });
 
-        const data = await response.json();
+        const contentType = response.headers.get('Content-Type') || '';
+        const data = contentType.startsWith('text/event-stream')
+            ? await readPublishStream(response, publishBtn, selectedVkGroups.length + selectedTgChannels.length)
+            : await response.json();
 
         if (data.success) {
             if (scheduledTime) {